@@ -0,0 +1,315 @@
+"""!
+@file aim_lut.py
+This file contains a lookup table which converts the position of a target in
+the camera image straight into the encoder ticks through which the yaw and
+pitch motors must turn to point the turret at it. The table replaces the
+assumption of linear optics and the hand-tuned offsets, so that lens
+distortion and the offset between the camera and the barrel are taken into
+account without any trigonometry while aiming.
+
+The table holds the ticks at a grid of knots every few pixels and is
+interpolated bilinearly. It is made from calibration samples as follows:
+-# With the turret at its starting pose, put a warm target somewhere in view
+   and note the target position given by
+   @c mlx_cam_mod.MLX_Cam.find_target_raw().
+-# Jog the turret until the barrel points at the target and note how many
+   ticks each encoder moved.
+-# Repeat for 10 to 20 target positions spread over the whole image, then pass
+   the samples to @c fit_aim_table() and @c save() the table.
+
+Positions use the same convention as the centroid functions in
+@c mlx_cam_mod: columns count from 1 at the left and rows count from 1 at the
+bottom of the image. The test code at the bottom fits a table to synthetic
+samples from a distorted lens and reports the aiming error.
+"""
+
+import struct
+from mlx90640.utils import array_filled
+from mlx90640.image import NUM_ROWS, NUM_COLS
+
+## Format of the header of a saved table: magic, columns, rows, step
+AIM_HEADER_FMT = '<4sHHH'
+## Marks a file as a saved aiming table
+AIM_MAGIC = b'AIMt'
+
+
+class AimTable:
+    """!
+    @brief   Interpolated table of encoder ticks for each target position.
+    """
+
+    def __init__(self, step=4):
+        """!
+        @brief   Allocates a table of zeros.
+        @param   step The spacing of the knots in pixels
+        """
+        ## The spacing of the knots in pixels
+        self.step = step
+        ## The number of knots across the image
+        self.cols = (NUM_COLS - 1 + step - 1) // step + 1
+        ## The number of knots up the image
+        self.rows = (NUM_ROWS - 1 + step - 1) // step + 1
+        size = self.cols * self.rows
+        ## Yaw ticks at each knot, in rows from the bottom of the image
+        self.yaw = array_filled('h', size)
+        ## Pitch ticks at each knot, in rows from the bottom of the image
+        self.pitch = array_filled('h', size)
+
+
+    @classmethod
+    def linear(cls, yaw_ticks_per_deg=6016/360, pitch_ticks_per_deg=3609.6/360,
+               yaw_offset=0, pitch_offset=0, fov=(55, 35), step=4):
+        """!
+        @brief   Makes a table for ideal linear optics.
+        @details Gives the same ticks as scaling the angles from
+                 @c mlx_cam_mod.MLX_Cam.centroid_to_angle() and subtracting
+                 fixed offsets, for use until the turret has been calibrated.
+        @param   yaw_ticks_per_deg Encoder ticks per degree of yaw
+        @param   pitch_ticks_per_deg Encoder ticks per degree of pitch
+        @param   yaw_offset Ticks subtracted from every yaw position
+        @param   pitch_offset Ticks subtracted from every pitch position
+        @param   fov The horizontal and vertical view angles of the camera
+        @param   step The spacing of the knots in pixels
+        @returns The new table
+        """
+        yaw_scale = fov[0] / NUM_COLS * yaw_ticks_per_deg
+        pitch_scale = fov[1] / NUM_ROWS * pitch_ticks_per_deg
+        return cls.from_function(
+            lambda x, y: ((x - NUM_COLS / 2) * yaw_scale - yaw_offset,
+                          (y - NUM_ROWS / 2) * pitch_scale - pitch_offset),
+            step)
+
+
+    @classmethod
+    def from_function(cls, mapping, step=4):
+        """!
+        @brief   Makes a table by evaluating a mapping at every knot.
+        @param   mapping A function which takes a target position x, y and
+                 returns a tuple of yaw and pitch ticks
+        @param   step The spacing of the knots in pixels
+        @returns The new table
+        """
+        table = cls(step)
+        idx = 0
+        for row in range(table.rows):
+            for col in range(table.cols):
+                yaw, pitch = mapping(1 + col * step, 1 + row * step)
+                table.yaw[idx] = round(yaw)
+                table.pitch[idx] = round(pitch)
+                idx += 1
+        return table
+
+
+    def ticks(self, c_x, c_y):
+        """!
+        @brief   Looks up the ticks which point the turret at a target.
+        @param   c_x The column of the target, counted from 1 at the left
+        @param   c_y The row of the target, counted from 1 at the bottom
+        @returns A tuple of the yaw and pitch encoder ticks
+        """
+        step = self.step
+        cols = self.cols
+        # knot coordinates, clamped so positions off the grid extrapolate
+        u = (c_x - 1) / step
+        v = (c_y - 1) / step
+        col = int(u)
+        row = int(v)
+        if col < 0:
+            col = 0
+        elif col > cols - 2:
+            col = cols - 2
+        if row < 0:
+            row = 0
+        elif row > self.rows - 2:
+            row = self.rows - 2
+        fu = u - col
+        fv = v - row
+
+        idx = row * cols + col
+        yaw = self.yaw
+        pitch = self.pitch
+        w00 = (1 - fu) * (1 - fv)
+        w01 = fu * (1 - fv)
+        w10 = (1 - fu) * fv
+        w11 = fu * fv
+        return (
+            round(yaw[idx] * w00 + yaw[idx + 1] * w01
+                  + yaw[idx + cols] * w10 + yaw[idx + cols + 1] * w11),
+            round(pitch[idx] * w00 + pitch[idx + 1] * w01
+                  + pitch[idx + cols] * w10 + pitch[idx + cols + 1] * w11),
+        )
+
+
+    def save(self, path):
+        """!
+        @brief   Saves the table to a file.
+        @param   path The name of the file to write
+        @returns @c True if the table was saved, @c False if the file
+                 couldn't be written
+        """
+        try:
+            with open(path, 'wb') as f:
+                f.write(struct.pack(AIM_HEADER_FMT, AIM_MAGIC,
+                                    self.cols, self.rows, self.step))
+                f.write(self.yaw)
+                f.write(self.pitch)
+        except OSError:
+            return False
+        return True
+
+
+    def load(self, path):
+        """!
+        @brief   Loads a table saved by @c save().
+        @details The table is left unchanged if the file can't be used.
+        @param   path The name of the file to read
+        @returns @c True if the table was loaded, @c False if the file is
+                 missing or isn't a saved table
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(struct.calcsize(AIM_HEADER_FMT))
+                if len(header) != struct.calcsize(AIM_HEADER_FMT):
+                    return False
+                magic, cols, rows, step = struct.unpack(AIM_HEADER_FMT, header)
+                if magic != AIM_MAGIC or step == 0:
+                    return False
+                size = cols * rows
+                yaw = array_filled('h', size)
+                pitch = array_filled('h', size)
+                if f.readinto(yaw) != 2 * size or f.readinto(pitch) != 2 * size:
+                    return False
+        except OSError:
+            return False
+        self.step = step
+        self.cols = cols
+        self.rows = rows
+        self.yaw = yaw
+        self.pitch = pitch
+        return True
+
+
+def _terms(x, y, count):
+    """!
+    @brief   Evaluates the terms of the fitted model at a target position
+    @details Up to a constant for the mount offset, linear terms for the
+             scale and rotation of the camera, quadratic terms for tilt and
+             cubic radial terms for barrel or pincushion distortion
+    """
+    u = (x - NUM_COLS / 2) / NUM_COLS
+    v = (y - NUM_ROWS / 2) / NUM_COLS
+    r2 = u * u + v * v
+    return (1.0, u, v, u * u, u * v, v * v, u * r2, v * r2)[:count]
+
+
+def _solve(matrix, rhs):
+    """!
+    @brief   Solves a small linear system by Gaussian elimination with pivoting
+    """
+    n = len(rhs)
+    for k in range(n):
+        pivot = max(range(k, n), key=lambda i: abs(matrix[i][k]))
+        if abs(matrix[pivot][k]) < 1e-12:
+            raise ValueError("calibration samples don't determine the fit")
+        matrix[k], matrix[pivot] = matrix[pivot], matrix[k]
+        rhs[k], rhs[pivot] = rhs[pivot], rhs[k]
+        for i in range(k + 1, n):
+            f = matrix[i][k] / matrix[k][k]
+            for j in range(k, n):
+                matrix[i][j] -= f * matrix[k][j]
+            rhs[i] -= f * rhs[k]
+    coeffs = [0.0] * n
+    for k in range(n - 1, -1, -1):
+        total = rhs[k]
+        for j in range(k + 1, n):
+            total -= matrix[k][j] * coeffs[j]
+        coeffs[k] = total / matrix[k][k]
+    return coeffs
+
+
+def fit_aim_table(samples, step=4):
+    """!
+    @brief   Fits an aiming table to calibration samples.
+    @details The yaw and pitch ticks are each fitted by least squares with
+             a polynomial in the target position, which is then evaluated at
+             the knots of the table. Eight or more samples fit the full model
+             including distortion; three to seven fit only offset, scale and
+             rotation.
+    @param   samples A sequence of (x, y, yaw_ticks, pitch_ticks) tuples: the
+             target position seen by the camera and the ticks which pointed
+             the turret at it
+    @param   step The spacing of the knots in pixels
+    @returns The fitted @c AimTable
+    @throws  ValueError if there are too few samples or they all lie in a line
+    """
+    count = 8 if len(samples) >= 8 else 3
+    if len(samples) < count:
+        raise ValueError("at least 3 calibration samples are needed")
+
+    coeffs = []
+    for axis in (2, 3):
+        normal = [[0.0] * count for _ in range(count)]
+        rhs = [0.0] * count
+        for sample in samples:
+            terms = _terms(sample[0], sample[1], count)
+            for i in range(count):
+                rhs[i] += terms[i] * sample[axis]
+                for j in range(count):
+                    normal[i][j] += terms[i] * terms[j]
+        coeffs.append(_solve(normal, rhs))
+    yaw_coeffs, pitch_coeffs = coeffs
+
+    def mapping(x, y):
+        terms = _terms(x, y, count)
+        return (sum(c * t for c, t in zip(yaw_coeffs, terms)),
+                sum(c * t for c, t in zip(pitch_coeffs, terms)))
+
+    return AimTable.from_function(mapping, step)
+
+
+# The test code fits a table to noisy samples from a simulated lens with
+# barrel distortion and an offset mount, then compares the aiming error with
+# that of the linear table
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    from timing import ticks_us, ticks_diff
+
+    def true_ticks(x, y):
+        # linear optics plus barrel distortion, a small roll and mount offset
+        u = (x - 16) / 16
+        v = (y - 12) / 16
+        k = 1 - 0.08 * (u * u + v * v)
+        yaw = (u * k + 0.02 * v) * 16 * (55 / 32) * (6016 / 360) + 35
+        pitch = (v * k - 0.02 * u) * 16 * (35 / 24) * (3609.6 / 360) - 60
+        return yaw, pitch
+
+    seed = 1
+    samples = []
+    for row in range(4):
+        for col in range(5):
+            x = 2 + col * 7 + 0.3 * row
+            y = 2 + row * 6.5 + 0.2 * col
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            noise = ((seed >> 20) & 0xF) / 4 - 2
+            yaw, pitch = true_ticks(x, y)
+            samples.append((x, y, yaw + noise, pitch - noise))
+
+    fitted = fit_aim_table(samples)
+    linear = AimTable.linear()
+    for name, table in (("linear", linear), ("fitted", fitted)):
+        worst = 0.0
+        for i in range(64):
+            x = 1 + 31 * (i % 8) / 7
+            y = 1 + 23 * (i // 8) / 7
+            yaw, pitch = true_ticks(x, y)
+            t_yaw, t_pitch = table.ticks(x, y)
+            worst = max(worst, abs(t_yaw - yaw), abs(t_pitch - pitch))
+        print(f"{name}: max aiming error {worst:.1f} ticks")
+
+    runs = 200
+    start = ticks_us()
+    for i in range(runs):
+        fitted.ticks(1 + (i % 31), 1 + (i % 23))
+    elapsed = ticks_diff(ticks_us(), start) / runs
+    print(f"lookup: {elapsed:.1f} us")
+## @endcond
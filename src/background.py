@@ -0,0 +1,123 @@
+"""!
+@file background.py
+This file contains an adaptive background model for the thermal camera. It
+replaces a reference image captured once from a cold wall, which goes stale
+as the room warms up, with a per-pixel running average that keeps learning
+from every frame while leaving the pixels of detected targets alone.
+
+The model works in the same 8 bit pixel values as
+@c mlx_cam_mod.MLX_Cam.get_bytes(), so its @c ref bytearray can be passed
+anywhere a reference array is expected.
+"""
+
+from array import array
+from mlx90640.image import IMAGE_SIZE
+
+
+class Background:
+    """!
+    @brief   Per-pixel exponential running average of camera frames.
+    @details The average of each pixel is kept in 8.8 fixed point so that
+             updates only need integer arithmetic. Frames are the raw
+             @c array('h') pixel values read from the camera.
+    """
+
+    def __init__(self, ref=None, shift=4, size=IMAGE_SIZE):
+        """!
+        @brief   Creates a background model.
+        @param   ref A bytearray reference image to start from, such as one
+                 captured from a cold wall, or @c None to start from zero
+        @param   shift Each update moves the average 1/2**shift of the way
+                 towards the new frame
+        @param   size The number of pixels in a frame
+        """
+        ## How quickly the average follows the frames, as a power of 2
+        self.shift = shift
+        ## The background image as 8 bit values, usable as a reference array
+        self.ref = bytearray(size) if ref is None else bytearray(ref)
+        ## The background image in 8.8 fixed point
+        self.level = array('H', (v << 8 for v in self.ref))
+        ## The number of frames averaged by @c learn() so far
+        self.learned = 0
+
+
+    def learn(self, raw):
+        """!
+        @brief   Adds a frame to the bootstrap average of the background.
+        @details Averages frames equally, so a clean background is learned
+                 quickly when no target is in view, e.g. while the turret is
+                 turning around. The first frame replaces the old background.
+        @param   raw The raw @c array('h') of pixel values
+        """
+        level = self.level
+        ref = self.ref
+        self.learned += 1
+        n = self.learned
+        for i in range(len(level)):
+            v = level[i]
+            v += ((((raw[i] + 128) & 0xFF) << 8) - v) // n
+            level[i] = v
+            ref[i] = (v + 0x80) >> 8 if v < 0xFF80 else 0xFF
+
+
+    def update(self, raw, limit=None, mask=None):
+        """!
+        @brief   Moves the background towards a frame, except where targets are.
+        @param   raw The raw @c array('h') of pixel values
+        @param   limit Pixels which would count as warm with this limit in
+                 @c mlx_cam_mod.MLX_Cam.find_angle() are left unchanged;
+                 @c None to update every pixel
+        @param   mask A sequence which is nonzero for pixels to leave
+                 unchanged, such as @c blob_detect.BlobDetector.labels, or
+                 @c None
+        """
+        level = self.level
+        ref = self.ref
+        shift = self.shift
+        thresh = 0x7FFF if limit is None else limit - 255
+        for i in range(len(level)):
+            byte = (raw[i] + 128) & 0xFF
+            if byte - ref[i] > thresh:
+                continue
+            if mask is not None and mask[i]:
+                continue
+            v = level[i]
+            v += ((byte << 8) - v) >> shift
+            level[i] = v
+            ref[i] = (v + 0x80) >> 8 if v < 0xFF80 else 0xFF
+
+
+    def save(self, path):
+        """!
+        @brief   Saves the background to a file.
+        @param   path The name of the file to write
+        @returns @c True if the background was saved, @c False if the file
+                 couldn't be written
+        """
+        try:
+            with open(path, 'wb') as f:
+                f.write(self.level)
+        except OSError:
+            return False
+        return True
+
+
+    def load(self, path):
+        """!
+        @brief   Loads a background saved by @c save().
+        @param   path The name of the file to read
+        @returns @c True if the background was loaded, @c False if the file
+                 is missing or the wrong size
+        """
+        level = array('H', self.level)
+        try:
+            with open(path, 'rb') as f:
+                if f.readinto(level) != 2 * len(level):
+                    return False
+        except OSError:
+            return False
+        self.level = level
+        for i in range(len(level)):
+            v = level[i]
+            self.ref[i] = (v + 0x80) >> 8 if v < 0xFF80 else 0xFF
+        return True
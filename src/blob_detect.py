@@ -0,0 +1,248 @@
+"""!
+@file blob_detect.py
+This file contains a connected-component labeller which splits the warm
+pixels of a thermal frame into separate blobs, so that two warm objects are
+not averaged into one centroid pointing at the empty space between them.
+
+All working storage is allocated when the detector is created; a frame is
+labelled in two passes using union-find with path compression. The test
+code at the bottom prints how long a frame takes to label.
+"""
+
+try:
+    from ucollections import namedtuple
+except ImportError:
+    from collections import namedtuple
+from mlx90640.utils import array_filled
+from mlx90640.image import NUM_ROWS, NUM_COLS
+
+
+## Statistics of one connected blob of warm pixels. Positions use the same
+#  convention as the centroid functions in @c mlx_cam_mod: columns count from
+#  1 at the left and rows count from 1 at the bottom of the image.
+Blob = namedtuple('Blob', ('area', 'total', 'x', 'y',
+                           'x_min', 'x_max', 'y_min', 'y_max'))
+
+
+def by_total(blob):
+    """!
+    @brief   Scores a blob by the sum of its pixel values
+    @param   blob The @c Blob to score
+    @returns The score; larger is a better target
+    """
+    return blob.total
+
+
+def by_area(blob):
+    """!
+    @brief   Scores a blob by its number of pixels
+    @param   blob The @c Blob to score
+    @returns The score; larger is a better target
+    """
+    return blob.area
+
+
+class BlobDetector:
+    """!
+    @brief   Finds connected blobs of pixels above a threshold in a frame.
+    @details Frames are sequences of 8 bit values in row order starting at the
+             top left pixel, such as the bytearrays produced by
+             @c mlx_cam_mod.MLX_Cam.get_foreground().
+    """
+
+    def __init__(self, width=NUM_COLS, height=NUM_ROWS, connectivity=8, score=by_total,
+                 max_blobs=8):
+        """!
+        @brief   Allocates the label and statistics buffers for a detector.
+        @param   width The width of the frames in pixels
+        @param   height The height of the frames in pixels
+        @param   connectivity 8 to join diagonal neighbours, 4 otherwise
+        @param   score A function which takes a @c Blob and returns a number;
+                 blobs are returned best (highest) first
+        @param   max_blobs The most blobs returned by @c detect()
+        """
+        size = width * height
+        ## The width of the frames in pixels
+        self.width = width
+        ## The height of the frames in pixels
+        self.height = height
+        ## Whether diagonal neighbours are part of the same blob
+        self.diagonal = connectivity == 8
+        ## The function used to rank blobs
+        self.score = score
+        ## The most blobs returned by @c detect()
+        self.max_blobs = max_blobs
+
+        ## The label of each pixel after @c detect(), 0 for background
+        self.labels = array_filled('H', size)
+
+        # Provisional labels can't outnumber half of the pixels
+        max_labels = size // 2 + 2
+        self._parent = array_filled('H', max_labels)
+        self._area = array_filled('H', max_labels)
+        self._total = array_filled('i', max_labels)
+        self._x_sum = array_filled('i', max_labels)
+        self._y_sum = array_filled('i', max_labels)
+        self._x_min = array_filled('B', max_labels)
+        self._x_max = array_filled('B', max_labels)
+        self._y_min = array_filled('B', max_labels)
+        self._y_max = array_filled('B', max_labels)
+
+
+    def _find(self, label):
+        """!
+        @brief   Finds the root of a label's set, compressing the path to it
+        """
+        parent = self._parent
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        while parent[label] != root:
+            next_label = parent[label]
+            parent[label] = root
+            label = next_label
+        return root
+
+
+    def _join(self, label, other):
+        """!
+        @brief   Merges the sets of two provisional labels, either of which may be 0
+        @returns The label to give the current pixel
+        """
+        if not other:
+            return label
+        if not label:
+            return other
+        a = self._find(label)
+        b = self._find(other)
+        if a < b:
+            self._parent[b] = a
+        elif b < a:
+            self._parent[a] = b
+        return label
+
+
+    def detect(self, frame, limit):
+        """!
+        @brief   Labels the blobs of pixels above a limit in a frame.
+        @param   frame A sequence of pixel values, 8 bits each
+        @param   limit Pixels with values above this are part of blobs
+        @returns A list of @c Blob objects, best scoring first
+        """
+        width = self.width
+        height = self.height
+        diagonal = self.diagonal
+        labels = self.labels
+        parent = self._parent
+        find = self._find
+        join = self._join
+        last_col = width - 1
+
+        # First pass: provisional labels, recording which ones touch
+        count = 0
+        idx = 0
+        for row in range(height):
+            for col in range(width):
+                if frame[idx] <= limit:
+                    labels[idx] = 0
+                    idx += 1
+                    continue
+
+                label = labels[idx - 1] if col > 0 else 0
+                if row > 0:
+                    up = idx - width
+                    label = join(label, labels[up])
+                    # diagonals, without wrapping around the row edges
+                    if diagonal:
+                        if col > 0:
+                            label = join(label, labels[up - 1])
+                        if col < last_col:
+                            label = join(label, labels[up + 1])
+
+                if not label:
+                    count += 1
+                    label = count
+                    parent[label] = label
+                labels[idx] = label
+                idx += 1
+
+        # Second pass: resolve each label to its root and collect statistics
+        area = self._area
+        total = self._total
+        x_sum = self._x_sum
+        y_sum = self._y_sum
+        x_min = self._x_min
+        x_max = self._x_max
+        y_min = self._y_min
+        y_max = self._y_max
+        for label in range(1, count + 1):
+            area[label] = 0
+            total[label] = 0
+            x_sum[label] = 0
+            y_sum[label] = 0
+            x_min[label] = 255
+            x_max[label] = 0
+            y_min[label] = 255
+            y_max[label] = 0
+
+        idx = 0
+        for row in range(height):
+            y = height - row
+            for col in range(width):
+                label = labels[idx]
+                if label:
+                    label = find(label)
+                    labels[idx] = label
+                    x = col + 1
+                    area[label] += 1
+                    total[label] += frame[idx]
+                    x_sum[label] += x
+                    y_sum[label] += y
+                    if x < x_min[label]:
+                        x_min[label] = x
+                    if x > x_max[label]:
+                        x_max[label] = x
+                    if y < y_min[label]:
+                        y_min[label] = y
+                    if y > y_max[label]:
+                        y_max[label] = y
+                idx += 1
+
+        blobs = []
+        for label in range(1, count + 1):
+            n = area[label]
+            if n:
+                blobs.append(Blob(n, total[label],
+                                  x_sum[label] / n, y_sum[label] / n,
+                                  x_min[label], x_max[label],
+                                  y_min[label], y_max[label]))
+        blobs.sort(key=self.score, reverse=True)
+        return blobs[:self.max_blobs]
+
+
+# The test code labels a synthetic frame with two warm objects and reports
+# how long it takes
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    from timing import ticks_us, ticks_diff
+
+    frame = bytearray(NUM_COLS * NUM_ROWS)
+    for row in range(NUM_ROWS):
+        for col in range(NUM_COLS):
+            if 4 <= col <= 8 and 10 <= row <= 16:
+                frame[row * NUM_COLS + col] = 200
+            if 22 <= col <= 25 and 3 <= row <= 12:
+                frame[row * NUM_COLS + col] = 180
+    frame[5 * NUM_COLS + 30] = 255  # a single hot pixel
+
+    detector = BlobDetector()
+    runs = 20
+    start = ticks_us()
+    for _ in range(runs):
+        blobs = detector.detect(frame, 100)
+    elapsed = ticks_diff(ticks_us(), start) / runs
+
+    for blob in blobs:
+        print(blob)
+    print(f"{elapsed / 1000:.2f} ms per frame")
+## @endcond
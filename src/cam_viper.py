@@ -0,0 +1,42 @@
+"""!
+@file cam_viper.py
+This file contains viper-compiled versions of the hot loops used to find a
+target in a camera frame. The viper emitter is not available on every
+MicroPython port, so modules which use these functions import them inside a
+@c try block and fall back to their plain Python versions.
+"""
+
+import micropython
+
+
+@micropython.viper
+def centroid_raw(raw, ref_array, limit: int, sums, start: int, end: int) -> int:
+    """!
+    @brief   Sums the positions of the warm pixels of a raw frame.
+    @details Viper version of @c MLX_Cam.calculate_centroid_raw() in
+             @c mlx_cam_mod. A pixel counts as warm with exactly the same
+             test as the plain Python version.
+    @param   raw The raw @c array('h') of 768 pixel values
+    @param   ref_array A bytearray of image values for a cold wall
+    @param   limit The value above which a pixel is considered warm
+    @param   sums An @c array('i') of 2 into which the sums of the column
+             and row numbers of the warm pixels are written
+    @param   start The index of the first pixel to look at
+    @param   end The index after the last pixel to look at
+    @returns The number of warm pixels
+    """
+    pix = ptr16(raw)
+    ref = ptr8(ref_array)
+    out = ptr32(sums)
+    thresh = limit - 255
+    num = 0
+    x_sum = 0
+    y_sum = 0
+    for i in range(start, end):
+        if ((pix[i] + 128) & 0xFF) - ref[i] > thresh:
+            x_sum += (i & 31) + 1
+            y_sum += 24 - (i >> 5)
+            num += 1
+    out[0] = x_sum
+    out[1] = y_sum
+    return num
@@ -0,0 +1,205 @@
+"""!
+@file centroid.py
+This file contains sub-pixel centroid functions for finding a target in a
+thermal frame. Unlike @c mlx_cam_mod.MLX_Cam.calculate_centroid_bytes(),
+which gives every pixel above the limit the same weight, each pixel is
+weighted by how far it is above the limit, so the result moves smoothly as a
+target moves across the pixel grid. Optionally, the position of the hottest
+pixel is refined by fitting a parabola through it and its neighbours.
+
+Sums are kept in integers during the pass over the frame; the only floating
+point work is the final division. Positions use the same convention as
+@c mlx_cam_mod: columns count from 1 at the left and rows count from 1 at the
+bottom of the image. The test code at the bottom measures the accuracy on
+synthetic Gaussian blobs and the time per frame.
+"""
+
+from mlx90640.image import NUM_ROWS, NUM_COLS, IMAGE_SIZE
+
+
+def _fit_peak(left, centre, right):
+    """!
+    @brief   Finds the offset of the vertex of a parabola through three points
+    @returns The offset from the centre point, -0.5 to 0.5
+    """
+    curve = left - 2 * centre + right
+    if curve >= 0:
+        return 0.0
+    offset = (left - right) / (2 * curve)
+    if offset > 0.5:
+        return 0.5
+    if offset < -0.5:
+        return -0.5
+    return offset
+
+
+def _result(w_sum, x_sum, y_sum, peak, value, peak_fit):
+    """!
+    @brief   Turns the sums from a pass over a frame into a position
+    """
+    if w_sum == 0:
+        return -1, -1, 0
+    c_x = x_sum / w_sum
+    c_y = y_sum / w_sum
+    if peak_fit:
+        col = peak & (NUM_COLS - 1)
+        row = peak >> 5
+        # axes where the hottest pixel is on the edge keep the centroid
+        if 0 < col < NUM_COLS - 1:
+            c_x = col + 1 + _fit_peak(value(peak - 1), value(peak), value(peak + 1))
+        # rows count down the frame but up in the result
+        if 0 < row < NUM_ROWS - 1:
+            c_y = NUM_ROWS - row - _fit_peak(value(peak - NUM_COLS),
+                                             value(peak),
+                                             value(peak + NUM_COLS))
+    return c_x, c_y, w_sum
+
+
+def weighted_centroid(frame, limit, start=0, end=IMAGE_SIZE, peak_fit=False):
+    """!
+    @brief   Calculates the intensity-weighted centroid of the warm pixels of a frame.
+    @param   frame A bytearray of 768 pixel values in order starting at the
+             top left pixel, such as from @c mlx_cam_mod.MLX_Cam.get_foreground()
+    @param   limit Pixels with values above this are warm; each is weighted
+             by its value minus the limit
+    @param   start The index of the first pixel to look at
+    @param   end The index after the last pixel to look at
+    @param   peak_fit If @c True, return the position of the peak found by
+             fitting parabolas across the hottest pixel instead
+    @returns A tuple of x, y values of the position and the total weight; the
+             position is -1, -1 if there are no warm pixels
+    """
+    w_sum = 0
+    x_sum = 0
+    y_sum = 0
+    peak = -1
+    peak_w = 0
+    for i in range(start, end):
+        w = frame[i] - limit
+        if w > 0:
+            w_sum += w
+            x_sum += w * ((i & 31) + 1)
+            y_sum += w * (NUM_ROWS - (i >> 5))
+            if w > peak_w:
+                peak, peak_w = i, w
+    return _result(w_sum, x_sum, y_sum, peak, frame.__getitem__, peak_fit)
+
+
+def weighted_centroid_raw(raw, ref_array, limit, start=0, end=IMAGE_SIZE,
+                          peak_fit=False):
+    """!
+    @brief   Calculates the intensity-weighted centroid directly from a raw frame.
+    @details Gives the same result as @c weighted_centroid() on the frame
+             from @c mlx_cam_mod.MLX_Cam.get_foreground(), without building
+             that frame first.
+    @param   raw The raw @c array('h') of pixel values
+    @param   ref_array A bytearray of image values for a cold wall in order
+             starting at top left pixel
+    @param   limit Pixels with values above this are warm; each is weighted
+             by its value minus the limit
+    @param   start The index of the first pixel to look at
+    @param   end The index after the last pixel to look at
+    @param   peak_fit If @c True, return the position of the peak found by
+             fitting parabolas across the hottest pixel instead
+    @returns A tuple of x, y values of the position and the total weight; the
+             position is -1, -1 if there are no warm pixels
+    """
+    # the pixel value of get_foreground() is clipped to 255
+    w_max = 255 - limit
+    thresh = limit - 255
+    w_sum = 0
+    x_sum = 0
+    y_sum = 0
+    peak = -1
+    peak_w = 0
+    for i in range(start, end):
+        w = ((raw[i] + 128) & 0xFF) - ref_array[i] - thresh
+        if w > 0:
+            if w > w_max:
+                w = w_max
+            w_sum += w
+            x_sum += w * ((i & 31) + 1)
+            y_sum += w * (NUM_ROWS - (i >> 5))
+            if w > peak_w:
+                peak, peak_w = i, w
+
+    def value(i):
+        byte = ((raw[i] + 128) & 0xFF) - ref_array[i] + 255
+        return 0 if byte < 0 else 255 if byte > 255 else byte
+
+    return _result(w_sum, x_sum, y_sum, peak, value, peak_fit)
+
+
+# The test code places Gaussian blobs at known sub-pixel positions in
+# synthetic frames and compares the error of each centroid method
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    import math
+    from array import array
+    from timing import ticks_us, ticks_diff
+
+    LIMIT = 60
+
+    def blob(x, y, sigma, amplitude=200, base=20, seed=1):
+        # x, y use the centroid convention; the noise is a repeatable LCG
+        frame = bytearray(IMAGE_SIZE)
+        k = -0.5 / (sigma * sigma)
+        for i in range(IMAGE_SIZE):
+            dx = (i & 31) + 1 - x
+            dy = NUM_ROWS - (i >> 5) - y
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            v = base + amplitude * math.exp(k * (dx * dx + dy * dy)) + (seed >> 27) - 8
+            frame[i] = 0 if v < 0 else 255 if v > 255 else int(v + 0.5)
+        return frame
+
+    def equal_centroid(frame, limit):
+        # what calculate_centroid_bytes() computes, for comparison
+        num = x_sum = y_sum = 0
+        for i in range(IMAGE_SIZE):
+            if frame[i] > limit:
+                x_sum += (i & 31) + 1
+                y_sum += NUM_ROWS - (i >> 5)
+                num += 1
+        return x_sum / num, y_sum / num, num
+
+    methods = (
+        ("equal weight", lambda f: equal_centroid(f, LIMIT)),
+        ("weighted", lambda f: weighted_centroid(f, LIMIT)),
+        ("peak fit", lambda f: weighted_centroid(f, LIMIT, peak_fit=True)),
+    )
+
+    ref = bytearray(b'\xff' * IMAGE_SIZE)
+    for sigma in (0.8, 1.2, 2.0):
+        errors = [[0.0, 0.0] for _ in methods]
+        count = 0
+        for step in range(25):
+            x = 10.0 + 0.37 * step
+            y = 8.0 + 0.29 * step
+            frame = blob(x, y, sigma, seed=step + 1)
+            # the raw version must agree exactly with the byte version
+            raw = array('h', (v - 128 for v in frame))
+            for peak_fit in (False, True):
+                assert (weighted_centroid_raw(raw, ref, LIMIT, peak_fit=peak_fit)
+                        == weighted_centroid(frame, LIMIT, peak_fit=peak_fit))
+            for err, (_, method) in zip(errors, methods):
+                c_x, c_y, _ = method(frame)
+                e = math.sqrt((c_x - x) ** 2 + (c_y - y) ** 2)
+                err[0] += e
+                err[1] = max(err[1], e)
+            count += 1
+        print(f"sigma {sigma} pixels:")
+        for err, (name, _) in zip(errors, methods):
+            print(f"  {name:12s} mean error {err[0] / count:.3f}, "
+                  f"max {err[1]:.3f} pixels")
+
+    frame = blob(15.3, 11.6, 1.2)
+    raw = array('h', (v - 128 for v in frame))
+    runs = 20
+    for name, method in methods + (
+            ("weighted raw", lambda f: weighted_centroid_raw(raw, ref, LIMIT)),):
+        start = ticks_us()
+        for _ in range(runs):
+            method(frame)
+        elapsed = ticks_diff(ticks_us(), start) / runs
+        print(f"{name:12s} {elapsed / 1000:.2f} ms per frame")
+## @endcond
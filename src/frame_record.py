@@ -0,0 +1,476 @@
+"""!
+@file frame_record.py
+This file contains a recorder which logs the subpages an MLX90640 gives the
+camera driver while the turret runs, and a stand-in I2C bus which plays
+such a log back, so that a bad aim can be reproduced offline and changes to
+the processing can be tested and timed on real captured data.
+
+Both work underneath the driver, at the level of the I2C bus, so the driver
+and the camera wrappers run unchanged:
+- On the board, wrap the camera's bus in a @c RecordingI2C, e.g.
+  @code
+  log = open("capture.log", "wb")
+  bus = RecordingI2C(I2C(1), log)
+  cam = mlx_cam_mod.MLX_Cam(bus)
+  ...
+  bus.flush()
+  log.close()
+  @endcode
+  The stream may also be a @c machine.UART to send the log to a PC.
+- On a PC, pass a @c ReplayI2C to the driver or wrapper instead of a real
+  bus. Subpages are served one after another as fast as the driver asks for
+  them, and reading the status register after the last one raises
+  @c EOFError. The test code at the bottom does this under the MicroPython
+  unix port:  micropython frame_record.py capture.log [limit]
+  Without a log it records and replays a simulated camera instead, and
+  checks that the replayed images and camera state match.
+
+A log starts with a header packed with @c LOG_HEADER_FMT followed by the
+camera's EEPROM, as the driver read it while setting up. Then comes one
+record per subpage. Each record has a header packed with
+@c RECORD_HEADER_FMT, holding a timestamp, the status and control
+registers, a bit for each row of pixel RAM the driver read and flags.
+After that header come those rows and, if @c RECORD_AUX is set, the
+auxiliary RAM, as the driver read them. The recorder makes no transfers of
+its own, so wrappers such as @c mlx_cam_mod.MLX_Cam.get_image(), which
+never read the auxiliary RAM, give logs without it. All words keep the
+camera's big endian order.
+"""
+
+import struct
+from timing import ticks_ms
+from mlx90640.regmap import (
+    REG_SIZE,
+    EEPROM_ADDRESS,
+    EEPROM_SIZE,
+    RAM_AUX_ADDRESS,
+    RAM_AUX_SIZE,
+)
+from mlx90640.image import (
+    PIX_DATA_ADDRESS,
+    PIX_ROW_SIZE,
+    NUM_ROWS,
+    NUM_COLS,
+    IMAGE_SIZE,
+)
+
+## Magic, format version and number of EEPROM words
+LOG_HEADER_FMT = '<4sHH'
+## Marks a file as a camera log
+LOG_MAGIC = b'MLXr'
+## The version of the log format
+LOG_VERSION = 2
+## Sync, timestamp in ms, status register, control register, a bit for each
+#  row of pixel RAM in the record and flags
+RECORD_HEADER_FMT = '<2sIHHIB'
+## Bytes which start every record
+RECORD_SYNC = b'SF'
+## The size of a record header in bytes
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FMT)
+## Flag set when the record holds the auxiliary RAM
+RECORD_AUX = 0x01
+
+## The address of the status register
+STATUS_ADDRESS = 0x8000
+## The address of the control register
+CONTROL_ADDRESS = 0x800D
+## Bit of the status register which is set when a subpage is ready
+DATA_AVAILABLE = 0x0008
+
+# the registers from the status register to the I2C address register
+_REGS_SIZE = 0x11
+# pixel and auxiliary RAM, which are read one after the other
+_RAM_SIZE = RAM_AUX_ADDRESS + RAM_AUX_SIZE - PIX_DATA_ADDRESS
+# the word at which the auxiliary RAM starts, counted from the pixel RAM
+_AUX_OFFSET = RAM_AUX_ADDRESS - PIX_DATA_ADDRESS
+
+
+class _DeviceMemory:
+    """!
+    @brief   Copy of the parts of the camera's memory used by the driver
+    """
+
+    def __init__(self):
+        ## The calibration EEPROM
+        self.eeprom = bytearray(EEPROM_SIZE * REG_SIZE)
+        ## Pixel RAM followed by auxiliary RAM
+        self.ram = bytearray(_RAM_SIZE * REG_SIZE)
+        ## The configuration registers
+        self.regs = bytearray(_REGS_SIZE * REG_SIZE)
+        ram = memoryview(self.ram)
+        ## A view of each row of pixel RAM
+        self.rows = tuple(ram[row * PIX_ROW_SIZE:(row + 1) * PIX_ROW_SIZE]
+                          for row in range(NUM_ROWS))
+        ## A view of the auxiliary RAM
+        self.aux = ram[_AUX_OFFSET * REG_SIZE:]
+        self._regions = (
+            (EEPROM_ADDRESS, memoryview(self.eeprom)),
+            (PIX_DATA_ADDRESS, ram),
+            (STATUS_ADDRESS, memoryview(self.regs)),
+        )
+
+    def _view(self, mem_addr, size):
+        for base, view in self._regions:
+            offset = (mem_addr - base) * REG_SIZE
+            if 0 <= offset and offset + size <= len(view):
+                return view[offset:offset + size]
+        return None
+
+    def read_into(self, mem_addr, buf):
+        view = self._view(mem_addr, len(buf))
+        if view is None:
+            raise OSError(f"no recorded data at 0x{mem_addr:04X}")
+        buf[:] = view
+
+    def write(self, mem_addr, buf):
+        view = self._view(mem_addr, len(buf))
+        if view is not None:
+            view[:] = buf
+
+    def get_reg(self, mem_addr):
+        offset = (mem_addr - STATUS_ADDRESS) * REG_SIZE
+        return (self.regs[offset] << 8) | self.regs[offset + 1]
+
+    def set_reg(self, mem_addr, value):
+        offset = (mem_addr - STATUS_ADDRESS) * REG_SIZE
+        self.regs[offset] = value >> 8
+        self.regs[offset + 1] = value & 0xFF
+
+
+class RecordingI2C:
+    """!
+    @brief   I2C bus wrapper which logs the subpages read from a camera.
+    @details Passes every transfer through to the real bus and keeps a copy
+             of what was read, noting which rows of pixel RAM and whether
+             the auxiliary RAM were read. A subpage ends when the driver
+             clears the data available flag; it is written to the log when
+             the driver next reads the status register, so that the
+             auxiliary RAM read for it by @c read_state() goes with it.
+             Call @c flush() before closing the stream to write the last
+             subpage.
+    """
+
+    def __init__(self, i2c, stream):
+        """!
+        @brief   Wraps a bus and starts a log.
+        @param   i2c The I2C bus to which the camera is attached
+        @param   stream An object with a @c write() method taking a buffer,
+                 such as a file opened in binary mode or a @c machine.UART
+        """
+        ## The real I2C bus
+        self.i2c = i2c
+        ## The stream to which the log is written
+        self.stream = stream
+        ## The number of subpages recorded
+        self.records = 0
+        self._mem = _DeviceMemory()
+        self._header = bytearray(RECORD_HEADER_SIZE)
+        self._started = False
+        self._pending = False
+        self._rows = 0
+        self._aux_read = False
+        self._status = 0
+        self._t_ms = 0
+
+
+    def scan(self):
+        return self.i2c.scan()
+
+
+    def readfrom_mem(self, addr, mem_addr, nbytes, *, addrsize=8):
+        data = self.i2c.readfrom_mem(addr, mem_addr, nbytes, addrsize=addrsize)
+        self._mirror(mem_addr, data)
+        return data
+
+
+    def readfrom_mem_into(self, addr, mem_addr, buf, *, addrsize=8):
+        self.i2c.readfrom_mem_into(addr, mem_addr, buf, addrsize=addrsize)
+        self._mirror(mem_addr, buf)
+
+
+    def writeto_mem(self, addr, mem_addr, buf, *, addrsize=8):
+        self.i2c.writeto_mem(addr, mem_addr, buf, addrsize=addrsize)
+        if mem_addr == STATUS_ADDRESS and not buf[1] & DATA_AVAILABLE:
+            # clearing the flag ends reading a subpage; keep the status as
+            # the driver last read it, before the flag was cleared
+            self._status = self._mem.get_reg(STATUS_ADDRESS)
+            self._t_ms = ticks_ms() & 0xFFFFFFFF
+            self._pending = True
+        self._mem.write(mem_addr, buf)
+
+
+    def flush(self):
+        """!
+        @brief   Writes the last subpage read to the log, if it isn't yet
+        """
+        if self._pending:
+            self._write_record()
+
+
+    def _mirror(self, mem_addr, buf):
+        """!
+        @brief   Keeps a copy of data read by the driver
+        @param   mem_addr The address in the camera from which it was read
+        @param   buf The data read
+        """
+        if mem_addr == STATUS_ADDRESS and self._pending:
+            self._write_record()
+        self._mem.write(mem_addr, buf)
+        offset = mem_addr - PIX_DATA_ADDRESS
+        end = offset + len(buf) // REG_SIZE
+        if 0 <= offset < IMAGE_SIZE:
+            for row in range(offset // NUM_COLS, (min(end, IMAGE_SIZE) - 1) // NUM_COLS + 1):
+                self._rows |= 1 << row
+        if offset < _RAM_SIZE and end > _AUX_OFFSET:
+            self._aux_read = True
+
+
+    def _write_record(self):
+        """!
+        @brief   Writes the subpage read before the flag was cleared to the log
+        """
+        mem = self._mem
+        stream = self.stream
+        if not self._started:
+            stream.write(struct.pack(LOG_HEADER_FMT, LOG_MAGIC, LOG_VERSION,
+                                     EEPROM_SIZE))
+            stream.write(mem.eeprom)
+            self._started = True
+        rows = self._rows
+        struct.pack_into(RECORD_HEADER_FMT, self._header, 0, RECORD_SYNC,
+                         self._t_ms, self._status, mem.get_reg(CONTROL_ADDRESS),
+                         rows, RECORD_AUX if self._aux_read else 0)
+        stream.write(self._header)
+        for row in range(NUM_ROWS):
+            if rows & (1 << row):
+                stream.write(mem.rows[row])
+        if self._aux_read:
+            stream.write(mem.aux)
+        self._rows = 0
+        self._aux_read = False
+        self._pending = False
+        self.records += 1
+
+
+class ReplayI2C:
+    """!
+    @brief   Stand-in I2C bus which plays back a log from @c RecordingI2C.
+    @details Serves the camera's memory from the log. Each time the driver
+             clears the data available flag and then reads the status
+             register again, the next subpage is loaded, replacing the rows
+             of pixel RAM and the auxiliary RAM it holds. Writes to the
+             camera's registers are kept until the next subpage replaces them.
+    """
+
+    def __init__(self, stream, addr=0x33):
+        """!
+        @brief   Reads the header and EEPROM of a log.
+        @param   stream A log opened for reading in binary mode
+        @param   addr The I2C address at which the camera appears
+        @throws  ValueError if the stream isn't a camera log
+        """
+        ## The log being played back
+        self.stream = stream
+        ## The I2C address of the camera
+        self.addr = addr
+        ## The time at which the current subpage was recorded, in ms
+        self.t_ms = None
+        ## Whether the current subpage's record holds the auxiliary RAM
+        self.aux_read = False
+        ## The number of subpages played back
+        self.records = 0
+        self._mem = _DeviceMemory()
+        self._consumed = True
+
+        header = stream.read(struct.calcsize(LOG_HEADER_FMT))
+        if len(header) != struct.calcsize(LOG_HEADER_FMT):
+            raise ValueError("not a camera log")
+        magic, version, eeprom_size = struct.unpack(LOG_HEADER_FMT, header)
+        if magic != LOG_MAGIC or version != LOG_VERSION or eeprom_size != EEPROM_SIZE:
+            raise ValueError("not a camera log")
+        if stream.readinto(self._mem.eeprom) != len(self._mem.eeprom):
+            raise ValueError("camera log is truncated")
+        self._header = bytearray(RECORD_HEADER_SIZE)
+
+
+    def scan(self):
+        return [self.addr]
+
+
+    def readfrom_mem(self, addr, mem_addr, nbytes, *, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, mem_addr, buf, addrsize=addrsize)
+        return bytes(buf)
+
+
+    def readfrom_mem_into(self, addr, mem_addr, buf, *, addrsize=8):
+        if mem_addr == STATUS_ADDRESS and self._consumed:
+            self._next_record()
+        self._mem.read_into(mem_addr, buf)
+
+
+    def writeto_mem(self, addr, mem_addr, buf, *, addrsize=8):
+        self._mem.write(mem_addr, buf)
+        if mem_addr == STATUS_ADDRESS and not buf[1] & DATA_AVAILABLE:
+            self._consumed = True
+
+
+    def _next_record(self):
+        """!
+        @brief   Loads the next subpage from the log
+        @throws  EOFError when there are no more subpages
+        """
+        mem = self._mem
+        stream = self.stream
+        if stream.readinto(self._header) != RECORD_HEADER_SIZE:
+            raise EOFError("end of camera log")
+        sync, t_ms, status, control, rows, flags = struct.unpack(
+            RECORD_HEADER_FMT, self._header)
+        if sync != RECORD_SYNC:
+            raise ValueError("camera log is damaged")
+        for row in range(NUM_ROWS):
+            if rows & (1 << row) and stream.readinto(mem.rows[row]) != PIX_ROW_SIZE:
+                raise EOFError("end of camera log")
+        self.aux_read = bool(flags & RECORD_AUX)
+        if self.aux_read and stream.readinto(mem.aux) != len(mem.aux):
+            raise EOFError("end of camera log")
+        mem.set_reg(STATUS_ADDRESS, status | DATA_AVAILABLE)
+        mem.set_reg(CONTROL_ADDRESS, control)
+        self.t_ms = t_ms
+        self.records += 1
+        self._consumed = False
+
+
+# Given a log, the test code replays it through the driver and the raw camera
+# wrapper, learning a background from the first few frames and then printing
+# the angle to the target in every frame and how long the processing took;
+# the processing needs the auxiliary RAM, so it is left out for logs without.
+# Without one it records frames from a simulated camera through the camera
+# wrapper, replays them, and checks that the images and camera state match
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    import sys
+    from io import BytesIO
+    from array import array
+    from timing import ticks_us, ticks_diff
+    from mlx_cam_mod import MLX_Cam
+    from background import Background
+
+    class SimCamera:
+        # serves made up calibration and pixel data; a new subpage is ready
+        # the next time the status is read after the flag has been cleared
+        def __init__(self):
+            self.mem = _DeviceMemory()
+            self.seed = 7
+            self.ready = False
+            for i in range(0, len(self.mem.eeprom), 2):
+                self.mem.eeprom[i], self.mem.eeprom[i + 1] = self.rand().to_bytes(2, 'big')
+            self.mem.set_reg(CONTROL_ADDRESS, 0x0001)
+
+        def rand(self):
+            self.seed = (self.seed * 1103515245 + 12345) & 0x7FFFFFFF
+            return (self.seed >> 8) & 0xFFFF
+
+        def scan(self):
+            return [0x33]
+
+        def readfrom_mem(self, addr, mem_addr, nbytes, *, addrsize=8):
+            buf = bytearray(nbytes)
+            self.readfrom_mem_into(addr, mem_addr, buf, addrsize=addrsize)
+            return bytes(buf)
+
+        def readfrom_mem_into(self, addr, mem_addr, buf, *, addrsize=8):
+            mem = self.mem
+            if mem_addr == STATUS_ADDRESS and not self.ready:
+                ram = mem.ram
+                for i in range(0, len(ram), 2):
+                    ram[i], ram[i + 1] = (100 + (self.rand() & 0x3FF)).to_bytes(2, 'big')
+                subpage = (mem.get_reg(STATUS_ADDRESS) & 1) ^ 1
+                mem.set_reg(STATUS_ADDRESS, DATA_AVAILABLE | subpage)
+                self.ready = True
+            mem.read_into(mem_addr, buf)
+
+        def writeto_mem(self, addr, mem_addr, buf, *, addrsize=8):
+            self.mem.write(mem_addr, buf)
+            if mem_addr == STATUS_ADDRESS and not buf[1] & DATA_AVAILABLE:
+                self.ready = False
+
+    if len(sys.argv) < 2:
+        log = BytesIO()
+        bus = RecordingI2C(SimCamera(), log)
+        cam = MLX_Cam(bus, double_buffer=False)
+        # whole frames, then a band of rows; the camera state is read after
+        # every frame but the last, which leaves its record without it
+        rois = (None, None, range(8, 14), None)
+        recorded = []
+        for k, roi in enumerate(rois):
+            cam.roi = roi
+            image = cam.get_image()
+            state = cam._camera.read_state() if k < len(rois) - 1 else None
+            recorded.append((array('h', image.pix), state))
+        bus.flush()
+
+        replay = ReplayI2C(BytesIO(log.getvalue()))
+        cam = MLX_Cam(replay, double_buffer=False)
+        for roi, (pix, state) in zip(rois, recorded):
+            cam.roi = roi
+            image = cam.get_image()
+            if roi is None:
+                assert image.pix == pix
+            else:
+                first, last = roi.start * NUM_COLS, roi.stop * NUM_COLS
+                assert image.pix[first:last] == pix[first:last]
+            if state is not None:
+                assert cam._camera.read_state() == state
+        assert not replay.aux_read
+        print(f"{bus.records} subpages in {len(log.getvalue())} bytes replayed; "
+              "images and camera state match")
+        sys.exit()
+
+    LEARN_FRAMES = 4
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with open(sys.argv[1], 'rb') as f:
+        bus = ReplayI2C(f)
+        cam = MLX_Cam(bus, double_buffer=False)
+        mlx = cam._camera
+        background = Background()
+
+        frames = 0
+        process_us = 0
+        find_us = 0
+        first_t = None
+        try:
+            while True:
+                while not mlx.has_data:
+                    pass
+                start = ticks_us()
+                raw = mlx.read_image()
+                if bus.aux_read:
+                    mlx.process_image(state=mlx.read_state())
+                process_us += ticks_diff(ticks_us(), start)
+                if first_t is None:
+                    first_t = bus.t_ms
+                if raw.subpage.id != 1:
+                    continue
+
+                frames += 1
+                if frames <= LEARN_FRAMES:
+                    background.learn(raw.pix)
+                    continue
+                start = ticks_us()
+                angles = cam.find_angle_raw(background.ref, raw.pix, limit=limit)
+                find_us += ticks_diff(ticks_us(), start)
+                print(f"{bus.t_ms} ms: {angles}")
+        except EOFError:
+            pass
+
+    print(f"{bus.records} subpages, {frames} frames")
+    if frames:
+        print(f"processing {process_us / frames / 1000:.2f} ms per frame, "
+              f"finding the target {find_us / max(1, frames - LEARN_FRAMES) / 1000:.2f} ms")
+        span = bus.t_ms - first_t
+        total = (process_us + find_us) / 1000
+        if total > 0 and span > 0:
+            print(f"{span / total:.1f} times faster than real time")
+## @endcond
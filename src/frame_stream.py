@@ -0,0 +1,332 @@
+"""!
+@file frame_stream.py
+This file contains a compact binary stream format for sending thermal camera
+frames off the board, fast enough to watch full rate thermal video while the
+turret runs, and a decoder for the other end.
+
+Each frame is sent as one packet:
+- a header, packed with @c PACKET_HEADER_FMT: the sync bytes
+  @c PACKET_SYNC, the format version, flags, a 16 bit sequence number, a
+  32 bit timestamp in milliseconds, the number of pixels and the number of
+  payload bytes;
+- the payload, one token per pixel in frame order. Key frames code the pixel
+  values themselves and other frames code the difference from the previous
+  frame. Each nonzero value is zigzag coded, so small negative numbers stay
+  small, and written as a varint of 7 bits per byte; a run of zeros is
+  written as a 0 followed by the varint length of the run;
+- the CRC-32 of the header and payload, little endian.
+
+Every @c keyframe_interval frames, and always first, a key frame is sent so a
+receiver which starts listening part way through, or loses a packet, can
+pick the stream up again. This file doesn't need the camera driver, so the
+decoder can also be used on a PC under CPython to watch the frames; the test
+code at the bottom checks that frames survive the round trip, or decodes a
+captured stream given as a file name on the command line.
+"""
+
+import struct
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+from array import array
+try:
+    from mlx90640.image import NUM_COLS, IMAGE_SIZE
+except ImportError:
+    # decoding on a PC, where the driver's MicroPython modules don't import
+    NUM_COLS = 32
+    IMAGE_SIZE = 32 * 24
+
+## Bytes which start every packet
+PACKET_SYNC = b'\xa5\x5a'
+## The version of the packet format
+PACKET_VERSION = 1
+## Sync, version, flags, sequence number, timestamp, pixels, payload bytes
+PACKET_HEADER_FMT = '<2sBBHIHH'
+## The size of a packet header in bytes
+PACKET_HEADER_SIZE = struct.calcsize(PACKET_HEADER_FMT)
+## The size of the CRC at the end of a packet in bytes
+PACKET_CRC_SIZE = 4
+
+## Flag set in packets which code pixel values rather than differences
+FLAG_KEYFRAME = 0x01
+
+
+class FrameStreamWriter:
+    """!
+    @brief   Codes frames into packets and writes them to a stream.
+    @details All buffers are allocated when the writer is created. Frames may
+             be raw @c array('h') pixel values, such as @c get_image().pix,
+             or bytearrays of 8 bit values; every frame sent by one writer
+             should be of the same kind.
+    """
+
+    def __init__(self, stream, size=IMAGE_SIZE, keyframe_interval=32):
+        """!
+        @brief   Allocates the packet buffer and the previous frame.
+        @param   stream An object with a @c write() method taking a buffer,
+                 such as a @c machine.UART, an open file or
+                 @c sys.stdout.buffer for the USB serial port
+        @param   size The number of pixels in a frame
+        @param   keyframe_interval A key frame is sent every this many frames
+        """
+        ## The stream to which packets are written
+        self.stream = stream
+        ## The number of pixels in a frame
+        self.size = size
+        ## The number of frames from one key frame to the next
+        self.keyframe_interval = keyframe_interval
+        ## The sequence number of the next packet
+        self.seq = 0
+        self._prev = array('h', (0 for _ in range(size)))
+        # worst case: each 17 bit zigzag value takes three varint bytes
+        self._buf = bytearray(PACKET_HEADER_SIZE + 3 * size + PACKET_CRC_SIZE)
+        self._mv = memoryview(self._buf)
+
+
+    def write(self, frame, t_ms=0):
+        """!
+        @brief   Codes a frame and writes it to the stream as one packet.
+        @param   frame The frame, a sequence of @c size pixel values
+        @param   t_ms The time at which the frame was captured, in ms
+        @returns The number of bytes written
+        """
+        buf = self._buf
+        prev = self._prev
+        key = self.seq % self.keyframe_interval == 0
+
+        n = PACKET_HEADER_SIZE
+        zeros = 0
+        for i in range(self.size):
+            value = frame[i]
+            d = value if key else value - prev[i]
+            prev[i] = value
+            if d == 0:
+                zeros += 1
+                continue
+            if zeros:
+                buf[n] = 0
+                n += 1
+                while zeros >= 0x80:
+                    buf[n] = (zeros & 0x7F) | 0x80
+                    zeros >>= 7
+                    n += 1
+                buf[n] = zeros
+                n += 1
+                zeros = 0
+            z = d << 1 if d >= 0 else ((-d) << 1) - 1
+            while z >= 0x80:
+                buf[n] = (z & 0x7F) | 0x80
+                z >>= 7
+                n += 1
+            buf[n] = z
+            n += 1
+        if zeros:
+            buf[n] = 0
+            n += 1
+            while zeros >= 0x80:
+                buf[n] = (zeros & 0x7F) | 0x80
+                zeros >>= 7
+                n += 1
+            buf[n] = zeros
+            n += 1
+
+        struct.pack_into(PACKET_HEADER_FMT, buf, 0, PACKET_SYNC, PACKET_VERSION,
+                         FLAG_KEYFRAME if key else 0, self.seq & 0xFFFF,
+                         t_ms & 0xFFFFFFFF, self.size, n - PACKET_HEADER_SIZE)
+        struct.pack_into('<I', buf, n, crc32(self._mv[:n]) & 0xFFFFFFFF)
+        n += PACKET_CRC_SIZE
+        self.seq += 1
+        self.stream.write(self._mv[:n])
+        return n
+
+
+    def restart(self):
+        """!
+        @brief   Makes the next frame a key frame, e.g. after the receiver resets
+        """
+        self.seq = 0
+
+
+def _read_varint(data, pos):
+    """!
+    @brief   Reads a varint from a buffer
+    @returns A tuple of the value and the position after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_packet(data, prev=None):
+    """!
+    @brief   Decodes the payload of one packet.
+    @param   data A buffer holding the whole packet, starting with its header
+    @param   prev The previous frame, which is updated in place, or @c None
+             if there isn't one; required for frames which aren't key frames
+    @returns A tuple of the sequence number, timestamp and decoded frame as a
+             list of pixel values
+    @throws  ValueError if the packet is damaged or can't be decoded
+    """
+    if len(data) < PACKET_HEADER_SIZE + PACKET_CRC_SIZE:
+        raise ValueError("packet too short")
+    sync, version, flags, seq, t_ms, count, length = struct.unpack_from(
+        PACKET_HEADER_FMT, data, 0)
+    end = PACKET_HEADER_SIZE + length
+    if sync != PACKET_SYNC or version != PACKET_VERSION:
+        raise ValueError("not a frame packet")
+    if len(data) < end + PACKET_CRC_SIZE:
+        raise ValueError("packet too short")
+    (crc,) = struct.unpack_from('<I', data, end)
+    if crc32(bytes(data[:end])) & 0xFFFFFFFF != crc:
+        raise ValueError("CRC mismatch")
+    key = flags & FLAG_KEYFRAME
+    if not key and (prev is None or len(prev) != count):
+        raise ValueError("delta frame without a previous frame")
+
+    frame = [0] * count if key else list(prev)
+    pos = PACKET_HEADER_SIZE
+    i = 0
+    while i < count:
+        if pos >= end:
+            raise ValueError("payload too short")
+        z, pos = _read_varint(data, pos)
+        if z == 0:
+            run, pos = _read_varint(data, pos)
+            i += run
+            continue
+        d = (z >> 1) if not z & 1 else -((z + 1) >> 1)
+        frame[i] = d if key else frame[i] + d
+        i += 1
+    if i != count:
+        raise ValueError("payload doesn't match the pixel count")
+    return seq, t_ms, frame
+
+
+class FrameStreamReader:
+    """!
+    @brief   Decodes the frames in a byte stream written by @c FrameStreamWriter.
+    @details Bytes may be fed in pieces of any size as they arrive. Damaged
+             packets are skipped, and frames are only returned once a key
+             frame has been received after any gap in the sequence numbers.
+    """
+
+    def __init__(self):
+        """!
+        @brief   Creates a reader which is waiting for a key frame.
+        """
+        ## The last frame decoded, or @c None
+        self.frame = None
+        ## The number of packets which were damaged or arrived out of sequence
+        self.errors = 0
+        self._data = bytearray()
+        self._seq = None
+
+
+    def feed(self, chunk):
+        """!
+        @brief   Adds received bytes and decodes any complete packets.
+        @param   chunk The bytes received
+        @returns A list of (sequence number, timestamp, frame) tuples
+        """
+        data = self._data
+        data.extend(chunk)
+        frames = []
+        while True:
+            start = data.find(PACKET_SYNC)
+            if start < 0:
+                # keep a last byte which might begin the next sync
+                del data[:max(0, len(data) - 1)]
+                break
+            del data[:start]
+            if len(data) < PACKET_HEADER_SIZE:
+                break
+            length = struct.unpack_from(PACKET_HEADER_FMT, data, 0)[6]
+            size = PACKET_HEADER_SIZE + length + PACKET_CRC_SIZE
+            if len(data) < size:
+                break
+            flags = data[3]
+            seq = struct.unpack_from(PACKET_HEADER_FMT, data, 0)[3]
+            in_sequence = self._seq is not None and seq == (self._seq + 1) & 0xFFFF
+            prev = self.frame if in_sequence else None
+            try:
+                if not (flags & FLAG_KEYFRAME or in_sequence):
+                    raise ValueError("waiting for a key frame")
+                seq, t_ms, frame = decode_packet(data[:size], prev)
+            except ValueError:
+                # not a good packet here; look for the next sync
+                self.errors += 1
+                del data[:1]
+                continue
+            del data[:size]
+            self.frame = frame
+            self._seq = seq
+            frames.append((seq, t_ms, frame))
+        return frames
+
+
+# The test code codes a series of synthetic frames, checks that they decode
+# to the same values and reports the compression and time per frame; given a
+# file name it decodes a captured stream instead
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    import sys
+    from timing import ticks_us, ticks_diff
+
+    if len(sys.argv) > 1:
+        reader = FrameStreamReader()
+        count = 0
+        with open(sys.argv[1], 'rb') as f:
+            while True:
+                chunk = f.read(4096)
+                if not chunk:
+                    break
+                for seq, t_ms, frame in reader.feed(chunk):
+                    count += 1
+                    print(f"frame {seq} at {t_ms} ms: min {min(frame)}, max {max(frame)}")
+        print(f"{count} frames, {reader.errors} errors")
+        sys.exit()
+
+    class Sink:
+        def __init__(self):
+            self.data = bytearray()
+        def write(self, buf):
+            self.data.extend(buf)
+
+    sink = Sink()
+    writer = FrameStreamWriter(sink, keyframe_interval=8)
+    frames = []
+    seed = 1
+    base = [-40 + (i % NUM_COLS) // 4 for i in range(IMAGE_SIZE)]
+    runs = 20
+    elapsed = 0
+    for k in range(runs):
+        frame = array('h', base)
+        for i in range(IMAGE_SIZE):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            if seed >> 29 == 0:
+                frame[i] += (seed >> 24) % 5 - 2  # a little noise
+            if 5 + k <= i % NUM_COLS <= 8 + k and 10 <= i // NUM_COLS <= 14:
+                frame[i] -= 60  # a moving target
+        frames.append(list(frame))
+        start = ticks_us()
+        writer.write(frame, 100 * k)
+        elapsed += ticks_diff(ticks_us(), start)
+
+    reader = FrameStreamReader()
+    # feed the stream in odd sized pieces, with some garbage in front
+    data = b'\x00\x5a\xa5' + bytes(sink.data)
+    decoded = []
+    for pos in range(0, len(data), 333):
+        decoded.extend(reader.feed(data[pos:pos + 333]))
+    assert [frame for _, _, frame in decoded] == frames
+    assert [seq for seq, _, _ in decoded] == list(range(runs))
+    print(f"{len(sink.data) / runs:.0f} bytes per frame against "
+          f"{2 * IMAGE_SIZE} raw, {elapsed / runs / 1000:.2f} ms to code a frame")
+## @endcond
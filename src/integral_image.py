@@ -0,0 +1,195 @@
+"""!
+@file integral_image.py
+This file contains a summed-area table (integral image) for thermal camera
+frames. Once the table has been built in one pass over a frame, the sum of
+the pixels in any rectangle takes four lookups, however large the rectangle
+is. That makes box filtering to remove single hot pixels, scoring windows
+which might hold a target, and checking how much warmth is left in a region
+of interest cheap enough to do every frame.
+
+Rectangles are given as the column and row of their top left pixel and of
+the pixel just past their bottom right corner, with rows counted from 0 at
+the top of the image, which is the order in which frames are stored. The
+test code at the bottom checks the sums against direct addition and prints
+how long each stage takes.
+"""
+
+from mlx90640.utils import array_filled
+from mlx90640.image import NUM_ROWS, NUM_COLS
+
+
+class IntegralImage:
+    """!
+    @brief   Summed-area table of a frame, for constant time rectangle sums.
+    @details The table has one more row and column than the frame; entry
+             (row, col) holds the sum of all the pixels above and to the
+             left of pixel (row, col).
+    """
+
+    def __init__(self, width=NUM_COLS, height=NUM_ROWS):
+        """!
+        @brief   Allocates the table.
+        @param   width The width of the frames in pixels
+        @param   height The height of the frames in pixels
+        """
+        ## The width of the frames in pixels
+        self.width = width
+        ## The height of the frames in pixels
+        self.height = height
+        ## The table, (height + 1) rows of (width + 1) sums
+        self.table = array_filled('i', (width + 1) * (height + 1))
+
+
+    def build(self, frame):
+        """!
+        @brief   Fills the table from a frame.
+        @param   frame A sequence of pixel values in row order starting at
+                 the top left pixel, such as the bytearray from
+                 @c mlx_cam_mod.MLX_Cam.get_foreground()
+        """
+        table = self.table
+        width = self.width
+        stride = width + 1
+        idx = 0
+        above = 1
+        here = stride + 1
+        for _ in range(self.height):
+            row_sum = 0
+            for _ in range(width):
+                row_sum += frame[idx]
+                table[here] = table[above] + row_sum
+                idx += 1
+                above += 1
+                here += 1
+            above += 1
+            here += 1
+
+
+    def rect_sum(self, col0, row0, col1, row1):
+        """!
+        @brief   Finds the sum of the pixels in a rectangle.
+        @param   col0 The column of the left edge of the rectangle
+        @param   row0 The row of the top edge of the rectangle
+        @param   col1 The column just past the right edge of the rectangle
+        @param   row1 The row just past the bottom edge of the rectangle
+        @returns The sum of the pixel values in the rectangle
+        """
+        table = self.table
+        stride = self.width + 1
+        top = row0 * stride
+        bottom = row1 * stride
+        return table[bottom + col1] - table[bottom + col0] \
+            - table[top + col1] + table[top + col0]
+
+
+    def box_filter(self, radius=1, out=None):
+        """!
+        @brief   Averages each pixel with those around it.
+        @details Each output pixel is the mean of the square of side
+                 2 * radius + 1 centred on it, shrunk where it would go past
+                 the edge of the frame. A single hot pixel is spread out and
+                 so drops below the limit, while a target several pixels
+                 across keeps its value.
+        @param   radius The number of pixels on each side of the centre
+        @param   out A bytearray to fill with the averages, or @c None to
+                 allocate one
+        @returns The bytearray of averaged pixel values
+        """
+        width = self.width
+        height = self.height
+        if out is None:
+            out = bytearray(width * height)
+        table = self.table
+        stride = width + 1
+        # the window edges along a row are the same for every row
+        lefts = bytes(max(0, col - radius) for col in range(width))
+        rights = bytes(min(width, col + radius + 1) for col in range(width))
+        idx = 0
+        for row in range(height):
+            top = max(0, row - radius)
+            bottom = min(height, row + radius + 1)
+            rows = bottom - top
+            top *= stride
+            bottom *= stride
+            for col in range(width):
+                left = lefts[col]
+                right = rights[col]
+                out[idx] = (table[bottom + right] - table[bottom + left]
+                            - table[top + right] + table[top + left]) \
+                    // (rows * (right - left))
+                idx += 1
+        return out
+
+
+    def best_window(self, win_width, win_height):
+        """!
+        @brief   Finds the window of a given size with the largest sum.
+        @details Useful for scoring where a target of about a known size is,
+                 without it being fooled by scattered warm pixels.
+        @param   win_width The width of the window in pixels
+        @param   win_height The height of the window in pixels
+        @returns A tuple of the sum in the best window and the column and
+                 row of its top left pixel
+        """
+        table = self.table
+        stride = self.width + 1
+        best = -1
+        best_col = 0
+        best_row = 0
+        for row in range(self.height - win_height + 1):
+            top = row * stride
+            bottom = top + win_height * stride
+            for col in range(self.width - win_width + 1):
+                right = col + win_width
+                total = table[bottom + right] - table[bottom + col] \
+                    - table[top + right] + table[top + col]
+                if total > best:
+                    best, best_col, best_row = total, col, row
+        return best, best_col, best_row
+
+
+# The test code checks the table against direct sums on a synthetic frame
+# and reports how long each stage takes
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    from timing import ticks_us, ticks_diff
+
+    frame = bytearray(NUM_COLS * NUM_ROWS)
+    seed = 1
+    for i in range(len(frame)):
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        frame[i] = 40 + (seed >> 26)
+        if 10 <= i % NUM_COLS <= 13 and 6 <= i // NUM_COLS <= 10:
+            frame[i] += 150
+    frame[20 * NUM_COLS + 3] = 255  # a single hot pixel
+
+    integral = IntegralImage()
+    integral.build(frame)
+    for col0, row0, col1, row1 in ((0, 0, NUM_COLS, NUM_ROWS), (3, 5, 9, 6),
+                                   (NUM_COLS - 1, NUM_ROWS - 1, NUM_COLS, NUM_ROWS),
+                                   (10, 6, 14, 11), (4, 4, 4, 9)):
+        direct = sum(frame[r * NUM_COLS + c] for r in range(row0, row1)
+                     for c in range(col0, col1))
+        assert integral.rect_sum(col0, row0, col1, row1) == direct
+
+    smooth = integral.box_filter(1)
+    for row in range(NUM_ROWS):
+        for col in range(NUM_COLS):
+            window = [frame[r * NUM_COLS + c]
+                      for r in range(max(0, row - 1), min(NUM_ROWS, row + 2))
+                      for c in range(max(0, col - 1), min(NUM_COLS, col + 2))]
+            assert smooth[row * NUM_COLS + col] == sum(window) // len(window)
+    print(f"hot pixel {frame[20 * NUM_COLS + 3]} -> {smooth[20 * NUM_COLS + 3]}, "
+          f"target centre {frame[8 * NUM_COLS + 11]} -> {smooth[8 * NUM_COLS + 11]}")
+    print(f"best 4x5 window (sum, col, row): {integral.best_window(4, 5)}")
+
+    runs = 20
+    for name, stage in (("build", lambda: integral.build(frame)),
+                        ("box filter", lambda: integral.box_filter(1, smooth)),
+                        ("best window", lambda: integral.best_window(4, 5))):
+        start = ticks_us()
+        for _ in range(runs):
+            stage()
+        elapsed = ticks_diff(ticks_us(), start) / runs
+        print(f"{name:12s} {elapsed / 1000:.2f} ms per frame")
+## @endcond
@@ -19,6 +19,9 @@ from machine import Pin, I2C
 from encoder_driver import EncoderDriver
 from motor_driver import MotorDriver
 from pid_control import PidControl
+from target_tracker import TargetTracker
+from background import Background
+from aim_lut import AimTable
 
 
 
@@ -29,6 +32,15 @@ S2_MOVE_MOTORS = 2
 S3_SHOOT = 3
 S4_PAUSE = 4
 
+# Warmth above the background at which a pixel is part of a target
+TARGET_LIMIT = 100
+# File in which the learned background is kept between runs
+BACKGROUND_FILE = "background.bin"
+# Rows either side of a target read while it is being tracked
+ROI_MARGIN = 4
+# File holding the fitted table of encoder ticks for each target position
+AIM_FILE = "aim_table.bin"
+
 state = S0_INIT
 
 def task_motors(pitch, yaw):
@@ -172,6 +184,8 @@ def main():
     
     yaw_position  = 0
     pitch_position = 0
+    # How long the last move to a target took, used to lead moving targets
+    move_time = 0
     
     state = S0_INIT
         
@@ -179,10 +193,15 @@ def main():
         
         try:
             if(state == S0_INIT):
-                # move yaw motor to turn around
+                # move yaw motor to turn around, learning the background from
+                # an equal average of the frames captured on the way
                 x = turn_around()
+                background.learned = 0
+                frames = cam.acquire(callback=lambda image: background.learn(image.pix))
                 while(next(x) != 0):
+                    next(frames)
                     utime.sleep_ms(20)
+                background.save(BACKGROUND_FILE)
                 
                 state = S1_TAKE_PICTURE
             
@@ -193,29 +212,38 @@ def main():
                     pass
                 
                 image = cam.get_image()
-                image_array = cam.get_bytes(image)
-                yaw_angle, pitch_angle = cam.find_angle(ref_array, image_array,limit = 100)
+                # rows outside the region of interest are left over from older frames
+                full_frame = cam.roi is None
+                target = cam.find_target_raw(background.ref, image.pix, limit = TARGET_LIMIT, weighted = True)
+                frame_time = utime.ticks_ms()
+                # Keep the background current, except where the target is
+                if full_frame:
+                    background.update(image.pix, TARGET_LIMIT)
 
-                print("yaw angle:", yaw_angle)
-                print("pitch angle:", pitch_angle)
+                print("target:", target)
                 
-                if yaw_angle != -60:
-                    yaw_position = round(yaw_angle * (6016/360))-yaw_offset
-                    pitch_position = round(pitch_angle * (3609.6/360))-pitch_offset
+                if target is not None:
+                    # Aim where the target will be once the motors get there
+                    tracker.update((target,), frame_time)
+                    c_x, c_y = tracker.predict_best(utime.ticks_add(frame_time, move_time))
+                    yaw_position, pitch_position = aim.ticks(c_x, c_y)
                     print(yaw_position)
                     print(pitch_position)
         
                     state = S2_MOVE_MOTORS
                 else:
+                    tracker.update((), frame_time)
                     state = S1_TAKE_PICTURE
                 
         
             # Move motors to desired angles
             if(state == S2_MOVE_MOTORS):
                 print("in state 2")
+                move_start = utime.ticks_ms()
                 x = task_motors(pitch_position, yaw_position)
                 while(next(x) != 0):
                     utime.sleep_ms(20)
+                move_time = utime.ticks_diff(utime.ticks_ms(), move_start)
                     
                 
                 state = S3_SHOOT
@@ -265,9 +293,13 @@ if __name__ == "__main__":
     
     # Create the camera object and set it up in default mode
     gc.collect()
-    cam = camera.MLX_Cam(i2c_bus)
-    # Explicitly define reference array with bytes (768 bytes)
+    cam = camera.MLX_Cam(i2c_bus, calib_cache="mlx_calib.bin", roi_margin=ROI_MARGIN)
+    # Explicitly define reference array with bytes (768 bytes), captured from a
+    # cold wall and used until a background has been learned
     ref_array = bytearray(b'\xe9\xe6\xea\xe7\xe9\xe5\xe8\xe6\xe8\xe5\xe9\xe5\xe7\xe2\xe6\xe3\xe8\xe1\xe7\xe3\xe8\xe1\xe6\xe2\xe8\xe1\xe7\xe1\xe6\xe0\xe8\xdf\xe7\xe5\xe3\xe3\xe5\xe3\xe3\xe1\xe6\xe4\xe3\xe1\xe5\xe1\xe1\xdf\xe5\xe1\xe1\xdf\xe5\xe0\xe1\xdf\xe5\xe0\xe3\xde\xe4\xdf\xe3\xdc\xe8\xe5\xe8\xe6\xe7\xe4\xe8\xe5\xe8\xe3\xe8\xe4\xe6\xe2\xe7\xe3\xe8\xe1\xe7\xe2\xe7\xe1\xe6\xe1\xe6\xdf\xe6\xe1\xe8\xdf\xe8\xdf\xe6\xe5\xe3\xe3\xe4\xe3\xe2\xe1\xe5\xe3\xe1\xe0\xe4\xe1\xe1\xdf\xe5\xe0\xe1\xdf\xe5\xdf\xe1\xde\xe5\xdf\xe1\xde\xe4\xe0\xe2\xdc\xe9\xe5\xe9\xe6\xea\xe5\xe8\xe6\xe9\xe3\xe8\xe4\xe9\xe3\xe7\xe3\xe9\xe2\xe7\xe3\xe8\xe0\xe7\xe1\xe8\xdf\xe6\xe0\xe6\xe0\xe7\xdf\xe5\xe4\xe2\xe1\xe6\xe3\xe2\xe1\xe6\xe2\xe2\xe1\xe5\xe2\xe1\xdf\xe6\xe2\xe2\xdf\xe5\xdf\xe1\xdd\xe5\xdf\xe1\xdd\xe4\xde\xe1\xdb\xe8\xe4\xe6\xe5\xe8\xe4\xe7\xe5\xe6\xe3\xe7\xe4\xe6\xe2\xe7\xe3\xe6\xe2\xe7\xe1\xe6\xdf\xe5\xe0\xe8\xdf\xe6\xe1\xe6\xdf\xe8\xde\xe4\xe1\xdd\xde\xe3\xe2\xdf\xdf\xe3\xe1\xe0\xdf\xe2\xe1\xdf\xde\xe4\xe0\xe0\xdd\xe3\xdc\xdd\xda\xe3\xde\xe1\xdc\xe4\xde\xe2\xda\xe8\xe5\xe7\xe5\xe6\xe4\xe7\xe5\xe7\xe3\xe8\xe6\xed\xea\xe9\xe5\xe8\xe2\xe7\xe3\xe6\xdf\xe6\xe1\xe6\xdf\xe6\xe0\xe6\xdf\xe7\xdf\xe3\xe3\xdf\xe1\xe3\xe1\xe0\xdf\xe3\xe1\xdf\xdf\xe5\xe4\xe0\xdf\xe5\xdf\xe0\xde\xe3\xde\xdf\xdc\xe4\xde\xdf\xdb\xe5\xde\xe1\xda\xe8\xe5\xe6\xe5\xe6\xe3\xe6\xe3\xe6\xe2\xe5\xe2\xe5\xe1\xe5\xe1\xe5\xdf\xe6\xe1\xe6\xdf\xe5\xdf\xe6\xdf\xe5\xe0\xe5\xde\xe7\xde\xe3\xe1\xde\xde\xe2\xe0\xde\xde\xe2\xdf\xde\xdd\xe1\xde\xde\xdc\xe2\xdd\xde\xdc\xe3\xde\xde\xdb\xe3\xdd\xde\xdc\xe2\xdd\xe1\xd9\xe6\xe3\xe5\xe3\xe4\xe2\xe5\xe3\xe5\xe1\xe6\xe1\xe4\xe0\xe4\xe1\xe5\xdf\xe3\xe0\xe5\xde\xe5\xe0\xe5\xde\xe5\xdf\xe5\xde\xe6\xde\xe1\xdf\xdc\xdc\xdf\xde\xdc\xdd\xe1\xdf\xdd\xdc\xdf\xde\xdd\xda\xe1\xdd\xdd\xdb\xe1\xdc\xdd\xdb\xe2\xdc\xde\xdb\xe1\xdc\xdf\xda\xe4\xe3\xe5\xe4\xe5\xe1\xe5\xe3\xe5\xe0\xe5\xe2\xe5\xdf\xe4\xe1\xe5\xe0\xe3\xdf\xe4\xdf\xe4\xdf\xe5\xde\xe4\xdf\xe3\xde\xe5\xde\xdf\xdf\xdc\xdc\xe0\xdd\xdb\xdc\xdf\xdd\xdb\xdb\xdf\xdc\xdc\xda\xe0\xdc\xdc\xda\xdf\xdc\xdc\xda\xe0\xdc\xdd\xd9\xe0\xdc\xde\xd8\xe5\xe4\xe4\xe3\xe4\xe1\xe4\xe2\xe4\xe0\xe3\xe1\xe5\xe0\xe3\xe0\xe5\xdf\xe3\xdf\xe3\xde\xe3\xdf\xe4\xdc\xe3\xde\xe3\xdd\xe3\xdc\xdf\xdf\xdb\xdc\xde\xde\xdb\xdb\xdf\xdc\xdb\xda\xdf\xdc\xdb\xd9\xe0\xdc\xdb\xd9\xde\xdb\xdb\xd9\xe0\xda\xdd\xd8\xdf\xdb\xde\xd7\xe2\xe2\xe3\xe3\xe3\xe1\xe3\xe1\xe3\xe1\xe4\xe1\xe3\xdf\xe4\xe1\xe3\xde\xe3\xde\xe3\xdd\xe3\xdf\xe4\xdd\xe3\xdf\xe4\xde\xe5\xde\xdc\xdd\xd9\xdb\xdd\xdc\xda\xd9\xdd\xdc\xdb\xda\xde\xdc\xdb\xdb\xdf\xdb\xda\xd9\xde\xda\xdb\xd9\xe0\xda\xdb\xd9\xde\xda\xdd\xd8\xe2\xe3\xe2\xe2\xe3\xe1\xe3\xe1\xe3\xe0\xe3\xe1\xe3\xe0\xe4\xe1\xe3\xde\xe3\xdf\xe4\xde\xe3\xdf\xe4\xde\xe3\xde\xe3\xdd\xe5\xdf\xdb\xdc\xd8\xda\xdb\xdb\xd9\xd9\xdc\xdb\xd9\xd9\xdc\xdc\xda\xd9\xdd\xda\xd9\xd7\xdd\xda\xda\xd8\xde\xda\xda\xd9\xde\xdb\xdc\xd8\xe2\xe2\xe2\xe3\xe2\xe1\xe3\xe1\xe2\xe0\xe1\xe0\xe2\xdf\xe3\xe0\xe3\xde\xe2\xdf\xe3\xde\xe2\xdf\xe3\xde\xe2\xdf\xe1\xde\xe2\xdd\xd7\xd8\xd3\xd6\xd7\xd8\xd4\xd5\xd8\xd8\xd5\xd5\xd8\xd7\xd6\xd4\xd9\xd6\xd4\xd5\xd9\xd6\xd5\xd4\xda\xd6\xd5\xd4\xd9\xd7\xd8\xd3')
+    # Adaptive background, starting from the last saved one or the reference
+    background = Background(ref_array)
+    background.load(BACKGROUND_FILE)
     # Initialize encoder objects
     enc_yaw = EncoderDriver(Pin.board.PC6, Pin.board.PC7, 8)
     enc_pitch = EncoderDriver( Pin.board.PB6,  Pin.board.PB7, 4)
@@ -277,6 +309,12 @@ if __name__ == "__main__":
     # Initialize proportional controllers with default values
     con_yaw = PidControl(Kp = 0.15,Ki = 0.0002,Kd = 0.03)
     con_pitch = PidControl(Kp = 0.15,Ki = 0.0002,Kd = 0.03)
+    # Tracker which follows targets between pictures
+    # Targets are tracked in image pixels, about 1.7 degrees each
+    tracker = TargetTracker(gate=3.0)
+    # Aiming table; linear optics with hand-tuned offsets until calibrated
+    aim = AimTable.linear(yaw_offset=yaw_offset, pitch_offset=pitch_offset)
+    aim.load(AIM_FILE)
     
     
     # Create  servo object for firing
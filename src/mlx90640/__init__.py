@@ -2,13 +2,17 @@ from ucollections import namedtuple
 from mlx90640.regmap import (
     REGISTER_MAP,
     EEPROM_MAP,
+    RAM_AUX_MAP,
     RegisterMap,
     CameraInterface,
+    MemoryInterface,
     REG_SIZE,
     EEPROM_ADDRESS,
     EEPROM_SIZE,
+    RAM_AUX_ADDRESS,
+    RAM_AUX_SIZE,
 )
-from mlx90640.calibration import CameraCalibration, TEMP_K
+from mlx90640.calibration import CameraCalibration, CalibrationCache, TEMP_K
 from mlx90640.image import RawImage, ProcessedImage, Subpage, get_pattern_by_id
 
 class CameraDetectError(Exception): pass
@@ -49,14 +53,31 @@ class MLX90640:
         self.iface = CameraInterface(i2c, addr)
         self.registers = RegisterMap(self.iface, REGISTER_MAP)
         self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True)
+
+        # snapshot of the auxiliary RAM block used by read_state()
+        self._aux_buf = bytearray(RAM_AUX_SIZE * REG_SIZE)
+        self._aux = RegisterMap(MemoryInterface(self._aux_buf, RAM_AUX_ADDRESS), RAM_AUX_MAP, readonly=True)
+
         self.calib = None
-        self.raw = None
+        self.raw = None    # raw image written by read_image()
+        self.front = None  # raw image handed off by swap_raw() when double buffering
         self.image = None
         self.last_read = None
 
-    def setup(self, *, calib=None, raw=None, image=None):
-        self.calib = calib or CameraCalibration(self.iface, self.eeprom)
+    def setup(self, *, calib=None, raw=None, image=None, calib_cache=None, double_buffer=False):
+        # calib_cache - path of a file caching the derived calibration arrays
+        # double_buffer - keep a second raw image so a frame handed off by
+        #                 swap_raw() is not overwritten by the next read
+        if calib is None:
+            # decode calibration from a single bulk read of the EEPROM
+            ee_image = self.dump_eeprom()
+            ee_iface = MemoryInterface(ee_image, EEPROM_ADDRESS)
+            self.eeprom = RegisterMap(ee_iface, EEPROM_MAP, readonly=True)
+            cache = CalibrationCache(calib_cache, ee_image) if calib_cache else None
+            calib = CameraCalibration(ee_iface, self.eeprom, cache=cache)
+        self.calib = calib
         self.raw = raw or RawImage()
+        self.front = RawImage() if double_buffer else None
         self.image = image or ProcessedImage(self.calib)
 
     @property
@@ -74,22 +95,26 @@ class MLX90640:
     def read_vdd(self):
         # supply voltage calculation (delta Vdd)
         # type: (self) -> float
-        vdd_pix = self.registers['vdd_pix'] * self._adc_res_corr()
-        return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
+        return self._calc_vdd(self.registers, self.registers['adc_resolution'])
 
-    def _adc_res_corr(self):
-        # type: (self) -> float
-        res_exp = self.calib.res_ee - self.registers['adc_resolution']
-        return 1 << res_exp
+    def _calc_vdd(self, regs, adc_resolution):
+        # type: (self, RegisterMap, int) -> float
+        res_exp = self.calib.res_ee - adc_resolution
+        vdd_pix = regs['vdd_pix'] * (1 << res_exp)
+        return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
 
     def read_ta(self):
         # ambient temperature calculation (delta Ta in degC)
         # type: (self) -> float
-        v_ptat = self.registers['ta_ptat']
-        v_be = self.registers['ta_vbe']
+        return self._calc_ta(self.registers, self.read_vdd())
+
+    def _calc_ta(self, regs, vdd):
+        # type: (self, RegisterMap, float) -> float
+        v_ptat = regs['ta_ptat']
+        v_be = regs['ta_vbe']
         v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
 
-        v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*self.read_vdd() - self.calib.ptat_25)
+        v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*vdd - self.calib.ptat_25)
 
         # print('v_ptat: ', v_ptat)
         # print('v_be:', v_be)
@@ -100,15 +125,26 @@ class MLX90640:
     def read_gain(self):
         # gain calculation
         # type: (self) -> float
-        return self.calib.gain / self.registers['gain']
+        return self._calc_gain(self.registers)
+
+    def _calc_gain(self, regs):
+        # type: (self, RegisterMap) -> float
+        return self.calib.gain / regs['gain']
 
     # tr - temperature of reflected environment
     def read_state(self, *, tr=None):
-        gain = self.read_gain()
-        cp_sp_0 = gain * self.registers['cp_sp_0']
-        cp_sp_1 = gain * self.registers['cp_sp_1']
+        # snapshot the auxiliary RAM block and control register, then
+        # compute everything from the snapshot
+        self.iface.read_into(RAM_AUX_ADDRESS, self._aux_buf)
+        aux = self._aux
+        adc_resolution = self.registers['adc_resolution']
 
-        ta = self.read_ta()
+        gain = self._calc_gain(aux)
+        cp_sp_0 = gain * aux['cp_sp_0']
+        cp_sp_1 = gain * aux['cp_sp_1']
+
+        vdd = self._calc_vdd(aux, adc_resolution)
+        ta = self._calc_ta(aux, vdd)
 
         ta_abs = ta + 25
         if self.calib.emissivity == 1:
@@ -120,7 +156,7 @@ class MLX90640:
             ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
 
         return CameraState(
-            vdd = self.read_vdd(),
+            vdd = vdd,
             ta = ta,
             ta_r = ta_r,
             gain = gain,
@@ -135,42 +171,54 @@ class MLX90640:
     def last_subpage(self):
         return self.registers['last_subpage']
 
-    def read_image(self, sp_id = None):
+    def read_image(self, sp_id = None, rows = None):
+        # rows - band of pixel rows to read, range(start, stop), or None for
+        # the whole frame; process_image() then compensates only that band
         if not self.has_data:
             raise DataNotAvailableError
         
         if sp_id is None:
             sp_id = self.last_subpage
 
-        subpage = Subpage(self.get_pattern(), sp_id)
+        subpage = Subpage(self.get_pattern(), sp_id, rows)
         self.last_read = subpage
 
         # print(f"read SP {subpage.id}")
-        self.raw.read(self.iface, subpage.sp_range())
+        self.raw.read(self.iface, subpage.sp_range(), subpage.sp_rows())
+        self.raw.subpage = subpage
         self.registers['data_available'] = 0
         return self.raw
 
-    def process_image(self, sp_id = None, state = None):
-        if self.last_read is None:
+    def swap_raw(self):
+        # hand the raw image just read over to the consumer and recycle the
+        # previous front image for the next read
+        # type: (self) -> RawImage
+        if self.front is None:
+            return self.raw
+        self.raw, self.front = self.front, self.raw
+        return self.front
+
+    def process_image(self, sp_id = None, state = None, raw = None):
+        # raw - raw image to compensate; by default the one last read, or
+        #       when double buffering the one last handed off by swap_raw(),
+        #       as self.raw is then the recycled buffer of the next read
+        if raw is None:
+            raw = self.raw if self.front is None else self.front
+        subpage = raw.subpage or self.last_read
+        if subpage is None:
             raise DataNotAvailableError
 
-        subpage = self.last_read
         if sp_id is not None:
             subpage.id = sp_id
 
         state = state or self.read_state()
 
         # print(f"process SP {subpage.id}")
-        raw_data = ((idx, self.raw[idx]) for idx in subpage.sp_range())
-        self.image.update(raw_data, subpage, state)
+        self.image.update(raw.pix, subpage, state)
         return self.image
 
-    # def dump_eeprom(self):
-    #     buf = bytearray(REG_SIZE)
-    #     for addr in eeprom_range:
-    #         offset = addr*REG_SIZE
-    #         self.iface.read_into(addr, buf)
-    #         print(buf)
-    #         eeprom[offset:offset+REG_SIZE] = buf
-    #     return bytes(eeprom)
-
+    def dump_eeprom(self):
+        # type: (self) -> bytearray
+        buf = bytearray(EEPROM_SIZE * REG_SIZE)
+        self.iface.read_into(EEPROM_ADDRESS, buf)
+        return buf
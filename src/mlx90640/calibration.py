@@ -1,8 +1,11 @@
+import struct
 from array import array
+from ubinascii import crc32
 from mlx90640.utils import (
     Struct, 
     StructProto,
     field_desc,
+    array_filled,
 )
 from mlx90640.regmap import REG_SIZE
 
@@ -24,11 +27,13 @@ CC_PROTO = StructProto((
 ))
 
 def _read_cc_iter(iface, base, size):
+    # the whole table is read in one transfer
+    words = bytearray(size // 4 * REG_SIZE)
+    iface.read_into(base, words)
     buf = bytearray(REG_SIZE)
     struct = Struct(buf, CC_PROTO)
-    for addr_off in range(size // 4):
-        cc_addr = base + addr_off
-        iface.read_into(cc_addr, buf)
+    for offset in range(0, len(words), REG_SIZE):
+        buf[:] = words[offset:offset+REG_SIZE]
         yield struct['0']
         yield struct['1']
         yield struct['2']
@@ -58,17 +63,14 @@ class PixelCalibrationData:
     def __init__(self, iface):
         pix_count = NUM_ROWS * NUM_COLS
         self._data = bytearray(pix_count * REG_SIZE)
+        iface.read_into(PIX_CALIB_ADDRESS, self._data)
 
-        failed = []
-        buf = bytearray(REG_SIZE)
-        for idx in range(pix_count):
-            offset = idx * REG_SIZE
-            iface.read_into(PIX_CALIB_ADDRESS + offset, buf)
-            if buf != bytes(REG_SIZE):
-                self._data[offset:offset+REG_SIZE] = buf
-            else:
-                failed.append(idx)
-        self.failed = tuple(failed)
+        # a zeroed calibration word marks a failed pixel
+        data = self._data
+        self.failed = tuple(
+            idx for idx in range(pix_count)
+            if not (data[idx*REG_SIZE] or data[idx*REG_SIZE + 1])
+        )
 
     def __len__(self):
         return len(self._data)//REG_SIZE
@@ -81,8 +83,89 @@ class PixelCalibrationData:
 
 TEMP_K = 273.15
 
+def bad_pixel_table(bad_pixels):
+    # neighbours used to interpolate each bad pixel: those of the 8 around it
+    # which are inside the frame and not bad themselves, as one flat array
+    # with the neighbours of bad_pixels[k] at neighbours[start[k]:start[k+1]]
+    # type: (Sequence[int]) -> tuple(array, array)
+    bad = set(bad_pixels)
+    neighbours = array('H')
+    start = array('H', (0,))
+    for bad_idx in bad_pixels:
+        row, col = divmod(bad_idx, NUM_COLS)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                r = row + d_row
+                c = col + d_col
+                if (d_row or d_col) and 0 <= r < NUM_ROWS and 0 <= c < NUM_COLS:
+                    idx = r*NUM_COLS + c
+                    if idx not in bad:
+                        neighbours.append(idx)
+        start.append(len(neighbours))
+    return neighbours, start
+
+# Calibration cache file layout: header, the derived per-pixel arrays in
+# _CACHE_ARRAYS order (native byte order), then the outlier indices
+CACHE_MAGIC = b'MLXc'
+CACHE_VERSION = const(1)
+CACHE_HEADER_FMT = '<4sHHI'  # magic, version, outlier count, EEPROM CRC32
+
+_CACHE_ARRAYS = (
+    ('pix_os_ref', 'h'),
+    ('pix_kta',    'f'),
+    ('pix_alpha',  'f'),
+    ('il_offset',  'f'),
+)
+
+class CalibrationCache:
+    # on-flash store for the derived per-pixel calibration arrays,
+    # valid only for the EEPROM image it was built from
+    def __init__(self, path, eeprom_image):
+        self.path = path
+        self.checksum = crc32(eeprom_image)
+
+    def load(self, calib):
+        # type: (self, CameraCalibration) -> bool
+        header_size = struct.calcsize(CACHE_HEADER_FMT)
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(header_size)
+                if len(header) != header_size:
+                    return False
+                magic, version, num_outliers, checksum = struct.unpack(CACHE_HEADER_FMT, header)
+                if magic != CACHE_MAGIC or version != CACHE_VERSION or checksum != self.checksum:
+                    return False
+
+                loaded = []
+                for name, typecode in _CACHE_ARRAYS + (('outliers', 'H'),):
+                    length = num_outliers if name == 'outliers' else IMAGE_SIZE
+                    arr = array_filled(typecode, length)
+                    if length and f.readinto(arr) != length * struct.calcsize(typecode):
+                        return False
+                    loaded.append(arr)
+        except OSError:
+            return False
+
+        for (name, _), arr in zip(_CACHE_ARRAYS, loaded):
+            setattr(calib, name, arr)
+        calib.outliers = tuple(loaded[-1])
+        return True
+
+    def save(self, calib):
+        header = struct.pack(
+            CACHE_HEADER_FMT, CACHE_MAGIC, CACHE_VERSION, len(calib.outliers), self.checksum
+        )
+        try:
+            with open(self.path, 'wb') as f:
+                f.write(header)
+                for name, _ in _CACHE_ARRAYS:
+                    f.write(getattr(calib, name))
+                f.write(array('H', calib.outliers))
+        except OSError:
+            pass  # no writable filesystem, recompute on next boot
+
 class CameraCalibration:
-    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False):
+    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False, cache=None):
         self.emissivity = emissivity
 
         # restore VDD sensor parameters
@@ -101,15 +184,9 @@ class CameraCalibration:
         # gain
         self.gain = eeprom['gain']
 
-        # pixel calibration data
-        self.pix_data = PixelCalibrationData(iface)
-        self.pix_os_ref = array('h', self._calc_pix_os_ref(iface, eeprom))
-        self.outliers = tuple(idx for idx, data in enumerate(self.pix_data) if data['outlier'])
-
         # IR data compensation
         self.kta_scale_1 = 1 << (eeprom['kta_scale_1'] + 8)
         self.kta_scale_2 = 1 << eeprom['kta_scale_2']
-        self.pix_kta = array('f', self._calc_pix_kta(eeprom))
 
         self.kv_scale = 1 << eeprom['kv_scale']
         self.kv_avg = (
@@ -134,7 +211,6 @@ class CameraCalibration:
             self.kv_cp = eeprom['kv_cp'] / self.kv_scale
 
         # sensitivity normalization
-        self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
         self.ksta = eeprom['ksta'] / 8192.0
 
         if use_tgc:
@@ -148,7 +224,6 @@ class CameraCalibration:
         self.il_chess_c1 = eeprom['il_chess_c1'] / 16.0
         self.il_chess_c2 = eeprom['il_chess_c2'] / 2.0
         self.il_chess_c3 = eeprom['il_chess_c3'] / 8.0
-        self.il_offset = array('f', self._calc_il_offset())
 
         # temperature calculation
         self.drift = 0  # temperature drift correction
@@ -173,6 +248,21 @@ class CameraCalibration:
         alpha_4 = alpha_3*(1.0 + ksto3*(ct4 - ct3))
         self.alpha_ext = (alpha_1, alpha_2, alpha_3, alpha_4)
 
+        # pixel calibration data
+        self.pix_data = PixelCalibrationData(iface)
+        if cache is None or not cache.load(self):
+            self.pix_os_ref = array('h', self._calc_pix_os_ref(iface, eeprom))
+            self.outliers = tuple(idx for idx, data in enumerate(self.pix_data) if data['outlier'])
+            self.pix_kta = array('f', self._calc_pix_kta(eeprom))
+            self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
+            self.il_offset = array('f', self._calc_il_offset())
+            if cache is not None:
+                cache.save(self)
+
+        # outliers and failed pixels, with the neighbours to patch them from
+        self.bad_pixels = tuple(sorted(set(self.outliers).union(self.pix_data.failed)))
+        self.bad_neighbours, self.bad_neighbour_start = bad_pixel_table(self.bad_pixels)
+
     def _calc_pix_os_ref(self, iface, eeprom):
         offset_avg = eeprom['pix_os_average']
         occ_scale_row = 1 << eeprom['scale_occ_row']
@@ -0,0 +1,83 @@
+""" Fast approximations used by the temperature calculation.
+
+make_root4() builds a fourth root for the range of the To calculation, which
+ProcessedImage(root4=...) then uses in calc_temperature(),
+calc_temperature_ext() and calc_temperature_frame() instead of two
+math.sqrt calls. Largest error against root4_exact over -40...300 degC:
+  size  32: 0.066 degC
+  size  64: 0.0077 degC (default)
+  size 128: 0.0007 degC
+Whether it is faster depends on the port. Under CPython on a PC the two
+square roots inline win (0.11 us against 0.64 us per root), as math.sqrt is
+a single C call; the table is meant for boards whose sqrt is done in
+software or whose float calls cost more than the table's arithmetic. Run
+the benchmark on the board to decide:  import mlx90640.fastmath
+or on a host with the MicroPython unix port:  micropython -m mlx90640.fastmath
+"""
+
+import math
+from array import array
+from mlx90640.calibration import TEMP_K
+
+def root4_exact(x):
+    return math.sqrt(math.sqrt(x))
+
+def make_root4(t_min=-40.0, t_max=300.0, size=64):
+    # Fourth root of x for x = (t + TEMP_K)**4 with t in [t_min, t_max] degC,
+    # which covers every root taken by the temperature calculation.
+    # A linear interpolation table over x seeds one Newton step; inputs
+    # outside the table fall back to the exact calculation.
+    x_lo = (t_min + TEMP_K)**4
+    x_hi = (t_max + TEMP_K)**4
+    step = (x_hi - x_lo)/size
+    scale = 1.0/step
+
+    knots = [root4_exact(x_lo + i*step) for i in range(size + 1)]
+    base = array('f', knots[:-1])
+    slope = array('f', ((knots[i+1] - knots[i])*scale for i in range(size)))
+    del knots
+
+    sqrt = math.sqrt
+    def root4(x):
+        d = x - x_lo
+        i = int(d*scale)
+        if 0 <= i < size:
+            r = base[i] + (d - i*step)*slope[i]
+            return 0.75*r + 0.25*x/(r*r*r)
+        return sqrt(sqrt(x))
+    return root4
+
+def root4_error(root4, t_min=-40.0, t_max=300.0, steps=3400):
+    # largest difference in degC between root4 and root4_exact over [t_min, t_max]
+    # type: (function, float, float, int) -> tuple(float, float)
+    worst, worst_t = 0.0, t_min
+    for k in range(steps + 1):
+        t = t_min + (t_max - t_min)*k/steps
+        x = (t + TEMP_K)**4
+        err = abs(root4(x) - root4_exact(x))
+        if err > worst:
+            worst, worst_t = err, t
+    return worst, worst_t
+
+
+## @cond NO_DOXY
+if __name__ == "__main__":
+    import utime as time
+
+    print("fourth root error against root4_exact, -40...300 degC")
+    for size in (32, 64, 128):
+        err, t = root4_error(make_root4(size=size))
+        print(f"  size {size:3d}: max error {err:.5f} degC at {t:.1f} degC")
+
+    xs = array('f', ((t + TEMP_K)**4 for t in range(-40, 300, 2)))
+    sqrt = math.sqrt
+    root4 = make_root4()
+    for name, run in (
+            ("inline sqrt", lambda: [sqrt(sqrt(x)) for x in xs]),
+            ("table", lambda: [root4(x) for x in xs])):
+        start = time.ticks_us()
+        for _ in range(20):
+            run()
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        print(f"{name}: {elapsed/(20*len(xs)):.3f} us per root")
+## @endcond
@@ -1,5 +1,4 @@
 import math
-import struct
 from array import array
 from ucollections import namedtuple
 from mlx90640.utils import (
@@ -7,21 +6,63 @@ from mlx90640.utils import (
     StructProto,
     field_desc,
     array_filled,
+    word_array,
 )
 
 from mlx90640.regmap import REG_SIZE
-from mlx90640.calibration import NUM_COLS, IMAGE_SIZE, TEMP_K
+from mlx90640.calibration import bad_pixel_table, NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
+
+# optional array backend for whole-frame temperature calculation
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+_NP_FLOAT = (getattr(np, 'float32', None) or np.float) if np is not None else None
 
-PIX_STRUCT_FMT = '>h'
 PIX_DATA_ADDRESS = const(0x0400)
+PIX_ROW_SIZE = const(32*2)  # bytes per row of pixel RAM
 
 class _BasePattern:
+    _sp_index = None  # per-subpage pixel index tables, built on first use
+    _sp_row_start = None  # position in the index table where each row starts
+
     @classmethod
-    def sp_range(cls, sp_id):
-        return (
-            idx for idx, sp in enumerate(cls.iter_sp()) 
-            if sp == sp_id
+    def sp_range(cls, sp_id, rows = None):
+        # rows - a band of pixel rows, range(start, stop), or None for all rows
+        # type: (cls, int, range) -> array
+        index = cls._sp_index
+        if index is None:
+            index = cls._sp_index = cls._build_sp_index()
+        if rows is None:
+            return index[sp_id]
+        row_start = cls._sp_row_start[sp_id]
+        return memoryview(index[sp_id])[row_start[rows.start]:row_start[rows.stop]]
+
+    @classmethod
+    def _build_sp_index(cls):
+        index = (
+            array_filled('H', IMAGE_SIZE//2),
+            array_filled('H', IMAGE_SIZE//2),
+        )
+        row_start = (
+            array_filled('H', NUM_ROWS + 1),
+            array_filled('H', NUM_ROWS + 1),
         )
+        count = [0, 0]
+        for idx, sp in enumerate(cls.iter_sp()):
+            if idx % NUM_COLS == 0:
+                row = idx//NUM_COLS
+                row_start[0][row] = count[0]
+                row_start[1][row] = count[1]
+            index[sp][count[sp]] = idx
+            count[sp] += 1
+        row_start[0][NUM_ROWS] = count[0]
+        row_start[1][NUM_ROWS] = count[1]
+        cls._sp_row_start = row_start
+        return index
 
     @classmethod
     def iter_sp(cls):
@@ -29,6 +70,11 @@ class _BasePattern:
             cls.get_sp(idx) for idx in range(IMAGE_SIZE)
         )
 
+    @classmethod
+    def sp_rows(cls, sp_id, rows = None):
+        # rows of pixel RAM that contain pixels of the subpage
+        return range(NUM_ROWS) if rows is None else rows
+
 class ChessPattern(_BasePattern):
     pattern_id = 0x1
 
@@ -43,6 +89,12 @@ class InterleavedPattern(_BasePattern):
     def get_sp(cls, idx):
         return idx//32 - (idx//64)*2
 
+    @classmethod
+    def sp_rows(cls, sp_id, rows = None):
+        if rows is None:
+            return range(sp_id, NUM_ROWS, 2)
+        return range(rows.start + ((rows.start ^ sp_id) & 1), rows.stop, 2)
+
 _READ_PATTERNS = {
     pat.pattern_id : pat for pat in (ChessPattern, InterleavedPattern)
 }
@@ -52,77 +104,247 @@ def get_pattern_by_id(pattern_id):
 
 
 class Subpage:
-    def __init__(self, pattern, sp_id):
+    def __init__(self, pattern, sp_id, rows = None):
         self.pattern = pattern
         self.id = sp_id
+        self.rows = rows  # band of pixel rows read, None for the whole frame
 
     def sp_range(self):
-        return self.pattern.sp_range(self.id)
+        return self.pattern.sp_range(self.id, self.rows)
+
+    def sp_rows(self):
+        return self.pattern.sp_rows(self.id, self.rows)
 
 
 ## Image Buffers
 
 class RawImage:
+    # copy of the pixel RAM, filled by block reads and then scattered into pix;
+    # only used during read() so it is shared by all raw images
+    _buf = None
+    _view = None
+    _words = None
+    _row_bufs = None
+
     def __init__(self):
         self.pix = array_filled('h', IMAGE_SIZE)
+        self.subpage = None  # the subpage last read into this image
+
+        if RawImage._buf is None:
+            buf = bytearray(IMAGE_SIZE * REG_SIZE)
+            mv = memoryview(buf)
+            RawImage._buf = buf
+            RawImage._view = mv
+            RawImage._words = word_array(buf, IMAGE_SIZE)
+            RawImage._row_bufs = tuple(
+                mv[row*PIX_ROW_SIZE:(row + 1)*PIX_ROW_SIZE] for row in range(NUM_ROWS)
+            )
 
     def __getitem__(self, idx):
         return self.pix[idx]
 
-    def read(self, iface, update_idx = None):
-        buf = bytearray(REG_SIZE)
-        update_idx = update_idx or range(IMAGE_SIZE)
-        for offset in update_idx:
-            iface.read_into(PIX_DATA_ADDRESS + offset, buf)
-            self.pix[offset] = struct.unpack(PIX_STRUCT_FMT, buf)[0]
+    def read(self, iface, update_idx = None, rows = None):
+        # read whole rows of pixel RAM in as few transfers as possible: a band
+        # of consecutive rows (chess pattern) in one, and only the rows of
+        # the subpage one at a time (interleaved pattern)
+        if rows is None or len(rows) == NUM_ROWS:
+            iface.read_into(PIX_DATA_ADDRESS, self._buf)
+        elif rows.step == 1:
+            iface.read_into(PIX_DATA_ADDRESS + rows.start*NUM_COLS,
+                self._view[rows.start*PIX_ROW_SIZE:rows.stop*PIX_ROW_SIZE])
+        else:
+            for row in rows:
+                iface.read_into(PIX_DATA_ADDRESS + row*NUM_COLS, self._row_bufs[row])
+
+        pix = self.pix
+        words = self._words
+        for idx in (range(IMAGE_SIZE) if update_idx is None else update_idx):
+            pix[idx] = words[idx]
 
 
 ImageLimits = namedtuple('ScaleLimits', ('min_h', 'max_h', 'min_idx', 'max_idx'))
 
-_INTERP_NEIGHBOURS = tuple(
-    row * NUM_COLS + col
-    for row in (-1, 0, 1)
-    for col in (-1, 0, 1)
-    if row != 0 or col != 0
-)
+def make_exclude_mask(exclude_idx):
+    # one bit per pixel, set for the pixels to leave out of limits
+    # type: (Iterable[int]) -> bytearray
+    mask = bytearray(IMAGE_SIZE//8)
+    for idx in exclude_idx:
+        mask[idx >> 3] |= 1 << (idx & 7)
+    return mask
 
 class ProcessedImage:
-    def __init__(self, calib):
+    def __init__(self, calib, *, ta_eps=0.05, vdd_eps=0.005,
+                 patch_bad=False, track_limits=None, root4=None):
         # pix_data should be a sequence of ints
         self.calib = calib
         self.v_ir = array_filled('f', IMAGE_SIZE, 0.0)
         self.alpha = array_filled('f', IMAGE_SIZE, 1.0)
         self.buf = array_filled('f', IMAGE_SIZE, 1.0)
 
-    def update(self, pix_data, subpage, state):
-        if self.calib.use_tgc:
-            pix_os_cp = self._calc_os_cp(subpage, state)
-            pix_alpha_cp = self.calib.pix_alpha_cp[subpage.id]
+        # per-pixel compensation folded for the Ta/Vdd they were computed at;
+        # offset is the effective offset already scaled by 1/emissivity and
+        # alpha is the Ta (and TGC) compensated sensitivity
+        self.offset = array_filled('f', IMAGE_SIZE, 0.0)
+        self.to = None  # object temperatures, allocated on first use
+
+        self.ta_eps = ta_eps    # degC of Ta drift before recomputing
+        self.vdd_eps = vdd_eps  # V of Vdd drift before recomputing
+        # fourth root for the To calculation, e.g. fastmath.make_root4();
+        # None takes two math.sqrt calls inline
+        self.root4 = root4
+
+        # 'buf' or 'v_ir' to find the limits of that array in update(), which
+        # are then available from the limits property; they cover every pixel
+        # as min()/max() of the array would, with bad pixels taken after patching
+        self.track_limits = track_limits
+        self.patch_bad = patch_bad
+        self._sp_limits = [None, None]
+        self._coeff_state = [None, None]  # (pattern, ta, vdd) for each subpage
+
+    def update(self, pix, subpage, state):
+        # pix should be the raw pixel array, only the subpage's pixels are used
+        if self._coeffs_stale(subpage, state):
+            self.update_coeffs(subpage, state)
+
+        calib = self.calib
+        offset = self.offset
+        alpha = self.alpha
+        v_ir_buf = self.v_ir
+        buf = self.buf
+        gain = state.gain/calib.emissivity
+
+        if self.track_limits is not None:
+            tgc_os_cp = calib.tgc*self._calc_os_cp(subpage, state) if calib.use_tgc else 0.0
+            self._update_tracked(pix, subpage, gain, tgc_os_cp)
+        elif calib.use_tgc:
+            ## IR data gradient compensation
+            tgc_os_cp = calib.tgc*self._calc_os_cp(subpage, state)
+            for idx in subpage.sp_range():
+                v_ir = pix[idx]*gain - offset[idx] - tgc_os_cp
+                v_ir_buf[idx] = v_ir
+                buf[idx] = v_ir/alpha[idx]
+        else:
+            for idx in subpage.sp_range():
+                # preserve v_ir for temperature calculations
+                v_ir = pix[idx]*gain - offset[idx]
+                v_ir_buf[idx] = v_ir
+                buf[idx] = v_ir/alpha[idx]
+
+        if self._patch_bad:
+            get_sp = subpage.pattern.get_sp
+            sp_id = subpage.id
+            rows = subpage.rows
+            for k, bad_idx in enumerate(calib.bad_pixels):
+                if get_sp(bad_idx) == sp_id and (rows is None or bad_idx//NUM_COLS in rows):
+                    self._patch_pixel(bad_idx, calib.bad_neighbours,
+                        calib.bad_neighbour_start[k], calib.bad_neighbour_start[k + 1])
+                    if self.track_limits is not None:
+                        self._track_pixel(bad_idx, sp_id)
+
+    @property
+    def patch_bad(self):
+        # interpolate the calibration's bad pixels of each subpage in update()
+        return self._patch_bad
+    @patch_bad.setter
+    def patch_bad(self, patch_bad):
+        self._patch_bad = patch_bad
+        self._bad_mask = make_exclude_mask(self.calib.bad_pixels if patch_bad else ())
+
+    def _update_tracked(self, pix, subpage, gain, tgc_os_cp):
+        # the compensation loop of update(), also finding the subpage's limits
+        offset = self.offset
+        alpha = self.alpha
+        v_ir_buf = self.v_ir
+        buf = self.buf
+        mask = self._bad_mask
+        track_buf = self.track_limits == 'buf'
 
-        for idx, raw in pix_data:
-            ## IR data compensation - offset, Vdd, and Ta
-            kta = self.calib.pix_kta[idx]
+        min_h, min_idx = None, None
+        max_h, max_idx = None, None
+        for idx in subpage.sp_range():
+            v_ir = pix[idx]*gain - offset[idx] - tgc_os_cp
+            v_ir_buf[idx] = v_ir
+            h = v_ir/alpha[idx]
+            buf[idx] = h
+            if mask[idx >> 3] & (1 << (idx & 7)):
+                continue
+            if not track_buf:
+                h = v_ir
+            if min_h is None or h < min_h:
+                min_h, min_idx = h, idx
+            if max_h is None or h > max_h:
+                max_h, max_idx = h, idx
 
-            row, col = divmod(idx, NUM_COLS)
-            kv = self.calib.kv_avg[row % 2][col % 2]
-            
-            offset = self.calib.pix_os_ref[idx]
-            offset *= (1 + kta*state.ta)*(1 + kv*state.vdd)
+        self._sp_limits[subpage.id] = (
+            None if min_h is None else ImageLimits(min_h, max_h, min_idx, max_idx)
+        )
 
-            v_os = raw*state.gain - offset
-            if subpage.pattern is InterleavedPattern:
-                v_os += self.calib.il_offset[idx]
-            v_ir = v_os / self.calib.emissivity
+    def _track_pixel(self, idx, sp_id):
+        # fold a pixel left out of the update() loop into the subpage's limits
+        h = (self.buf if self.track_limits == 'buf' else self.v_ir)[idx]
+        lim = self._sp_limits[sp_id]
+        if lim is None:
+            self._sp_limits[sp_id] = ImageLimits(h, h, idx, idx)
+        elif h < lim.min_h:
+            self._sp_limits[sp_id] = ImageLimits(h, lim.max_h, idx, lim.max_idx)
+        elif h > lim.max_h:
+            self._sp_limits[sp_id] = ImageLimits(lim.min_h, h, lim.min_idx, idx)
+
+    @property
+    def limits(self):
+        # ImageLimits of the tracked array over both subpages as of their
+        # last update(), or None if limits aren't being tracked
+        sp_0, sp_1 = self._sp_limits
+        if sp_0 is None or sp_1 is None:
+            return sp_0 or sp_1
+        low = sp_0 if sp_0.min_h <= sp_1.min_h else sp_1
+        high = sp_0 if sp_0.max_h >= sp_1.max_h else sp_1
+        return ImageLimits(low.min_h, high.max_h, low.min_idx, high.max_idx)
+
+    def _coeffs_stale(self, subpage, state):
+        last = self._coeff_state[subpage.id]
+        return (
+            last is None
+            or last[0] is not subpage.pattern
+            or abs(state.ta - last[1]) > self.ta_eps
+            or abs(state.vdd - last[2]) > self.vdd_eps
+        )
 
-            ## IR data gradient compensation
-            if self.calib.use_tgc:
-                v_ir -= self.calib.tgc*pix_os_cp
+    def update_coeffs(self, subpage, state):
+        # fold the slowly varying Ta/Vdd dependent terms into per-pixel arrays
+        calib = self.calib
+        pix_os_ref = calib.pix_os_ref
+        pix_kta = calib.pix_kta
+        pix_alpha = calib.pix_alpha
+        offset_buf = self.offset
+        alpha_buf = self.alpha
+
+        ta = state.ta
+        inv_emissivity = 1.0/calib.emissivity
+        ksta_ta = 1 + calib.ksta*ta
+
+        # (1 + kv*vdd) indexed by (row % 2)*2 + (col % 2)
+        kv_avg = calib.kv_avg
+        vdd = state.vdd
+        kv_vdd = (
+            1 + kv_avg[0][0]*vdd, 1 + kv_avg[0][1]*vdd,
+            1 + kv_avg[1][0]*vdd, 1 + kv_avg[1][1]*vdd,
+        )
+
+        il_offset = calib.il_offset if subpage.pattern is InterleavedPattern else None
+        tgc_alpha_cp = calib.tgc*calib.pix_alpha_cp[subpage.id] if calib.use_tgc else 0.0
 
-            # preserve v_ir for temperature calculations
-            self.v_ir[idx] = v_ir
+        # always the whole subpage, even when only a band of rows was read
+        for idx in subpage.pattern.sp_range(subpage.id):
+            ## IR data compensation - offset, Vdd, and Ta
+            offset = pix_os_ref[idx]*(1 + pix_kta[idx]*ta)*kv_vdd[((idx >> 4) & 2) | (idx & 1)]
+            if il_offset is not None:
+                offset -= il_offset[idx]
+            offset_buf[idx] = offset*inv_emissivity
 
-            alpha = self._calc_alpha(idx, state.ta)
-            self.buf[idx] = v_ir/alpha
+            alpha_buf[idx] = (pix_alpha[idx] - tgc_alpha_cp)*ksta_ta
+
+        self._coeff_state[subpage.id] = (subpage.pattern, ta, vdd)
 
     def _calc_os_cp(self, subpage, state):
         pix_os_cp = self.calib.pix_os_cp[subpage.id]
@@ -142,30 +364,28 @@ class ProcessedImage:
             for pix_os_cp_sp, gain_cp_sp in zip(pix_os_cp, state.gain_cp)
         ]
 
-    def _calc_alpha(self, idx, ta):
-        alpha = self.calib.pix_alpha[idx]
-        if self.calib.use_tgc:
-            alpha -= self.calib.tgc*pix_alpha_cp
-        alpha *= (1 + self.calib.ksta*ta)
-        return alpha
-
     def _calc_to(self, idx, alpha, ta_r):
         v_ir = self.v_ir[idx]
+        root4 = self.root4
+        sqrt = math.sqrt
 
-        s_x = v_ir*(alpha**3) + ta_r*(alpha**4)
-        s_x = math.sqrt(math.sqrt(s_x))*self.calib.ksto[1]
+        # (v_ir*alpha**3 + ta_r*alpha**4)**(1/4), kept in the range of To**4
+        s_x = v_ir/alpha + ta_r
+        s_x = sqrt(sqrt(s_x)) if root4 is None else root4(s_x)
+        s_x *= alpha*self.calib.ksto[1]
 
         to = v_ir/(alpha*(1 - TEMP_K*self.calib.ksto[1]) + s_x) + ta_r
-        to = math.sqrt(math.sqrt(to)) - TEMP_K
+        to = (sqrt(sqrt(to)) if root4 is None else root4(to)) - TEMP_K
         return to + self.calib.drift
 
     def calc_temperature(self, idx, state):
-        alpha = self._calc_alpha(idx, state.ta)
+        # alpha with TGC and Ta folded in by the last update() of the pixel
+        alpha = self.alpha[idx]
         return self._calc_to(idx, alpha, state.ta_r)
 
     def calc_temperature_ext(self, idx, state):
         v_ir = self.v_ir[idx]
-        alpha = self._calc_alpha(idx, state.ta)
+        alpha = self.alpha[idx]
         to = self._calc_to(idx, alpha, state.ta_r)
 
         band = self._get_range_band(to)
@@ -176,18 +396,67 @@ class ProcessedImage:
         ksto_ext = self.calib.ksto[band]
         ct = self.calib.ct[band]
         to_ext = v_ir/(alpha*alpha_ext*(1 + ksto_ext*(to - ct))) + state.ta_r
-        to_ext = math.sqrt(math.sqrt(to_ext)) - TEMP_K
+        root4 = self.root4
+        if root4 is None:
+            to_ext = math.sqrt(math.sqrt(to_ext)) - TEMP_K
+        else:
+            to_ext = root4(to_ext) - TEMP_K
         return to_ext  + self.calib.drift
 
+    def calc_temperature_frame(self, state, out=None, *, use_np=True):
+        # object temperature of every pixel in degC, written into out
+        # (an array('f') of IMAGE_SIZE); uses alpha as folded by the last update()
+        if out is None:
+            if self.to is None:
+                self.to = array_filled('f', IMAGE_SIZE, 0.0)
+            out = self.to
+
+        ksto = self.calib.ksto[1]
+        k_alpha = 1 - TEMP_K*ksto
+        ta_r = state.ta_r
+        to_offset = self.calib.drift - TEMP_K
+
+        # s_x = (v_ir*alpha**3 + ta_r*alpha**4)**(1/4) * ksto
+        #     = alpha*ksto * (v_ir/alpha + ta_r)**(1/4)
+        # the array backend takes its own square roots, root4 is per value
+        if use_np and np is not None:
+            v_ir = np.frombuffer(self.v_ir, dtype=_NP_FLOAT)
+            alpha = np.frombuffer(self.alpha, dtype=_NP_FLOAT)
+            s_x = alpha*ksto*np.sqrt(np.sqrt(v_ir/alpha + ta_r))
+            to = np.sqrt(np.sqrt(v_ir/(alpha*k_alpha + s_x) + ta_r)) + to_offset
+            np.frombuffer(out, dtype=_NP_FLOAT)[:] = to
+            return out
+
+        v_ir = self.v_ir
+        alpha = self.alpha
+        root4 = self.root4
+        if root4 is None:
+            sqrt = math.sqrt
+            for idx in range(IMAGE_SIZE):
+                a = alpha[idx]
+                v = v_ir[idx]
+                s_x = a*ksto*sqrt(sqrt(v/a + ta_r))
+                out[idx] = sqrt(sqrt(v/(a*k_alpha + s_x) + ta_r)) + to_offset
+        else:
+            for idx in range(IMAGE_SIZE):
+                a = alpha[idx]
+                v = v_ir[idx]
+                s_x = a*ksto*root4(v/a + ta_r)
+                out[idx] = root4(v/(a*k_alpha + s_x) + ta_r) + to_offset
+        return out
+
     def _get_range_band(self, t):
         return sum(1 for ct in self.calib.ct if t >= ct) - 1
 
-    def calc_limits(self, *, exclude_idx=()):
+    def calc_limits(self, *, exclude_idx=(), exclude_mask=None):
         # find min/max in place to keep mem usage down
+        # exclude_mask - bitmask from make_exclude_mask(), used instead of exclude_idx
+        if exclude_mask is None:
+            exclude_mask = make_exclude_mask(exclude_idx)
         min_h, min_idx = None, None
         max_h, max_idx = None, None
         for idx, h in enumerate(self.buf):
-            if idx in exclude_idx:
+            if exclude_mask[idx >> 3] & (1 << (idx & 7)):
                 continue
             if min_h is None or h < min_h:
                 min_h, min_idx = h, idx
@@ -195,14 +464,71 @@ class ProcessedImage:
                 max_h, max_idx = h, idx
         return ImageLimits(min_h, max_h, min_idx, max_idx)
 
-    def interpolate_bad_pixels(self, bad_pixels):
-        for bad_idx in bad_pixels:
-            count = 0
-            total = 0
-            for offset in _INTERP_NEIGHBOURS:
-                idx = bad_idx + offset
-                if idx in range(IMAGE_SIZE) and idx not in bad_pixels:
-                    count += 1
-                    total += self.buf[idx]
-            if count > 0:
-                self.buf[bad_idx] = total/count
+    def interpolate_bad_pixels(self, bad_pixels = None):
+        # bad_pixels - pixel indices to patch, by default the calibration's
+        # outliers and failed pixels, whose neighbour table is precomputed
+        if bad_pixels is None:
+            bad_pixels = self.calib.bad_pixels
+            neighbours = self.calib.bad_neighbours
+            start = self.calib.bad_neighbour_start
+        else:
+            neighbours, start = bad_pixel_table(bad_pixels)
+        for k, bad_idx in enumerate(bad_pixels):
+            self._patch_pixel(bad_idx, neighbours, start[k], start[k + 1])
+
+    def _patch_pixel(self, bad_idx, neighbours, first, end):
+        # average the neighbours' v_ir/alpha, then scale back by the pixel's own alpha
+        if first == end:
+            return
+        buf = self.buf
+        total = 0.0
+        for n in range(first, end):
+            total += buf[neighbours[n]]
+        value = total/(end - first)
+        buf[bad_idx] = value
+        self.v_ir[bad_idx] = value*self.alpha[bad_idx]
+
+
+# Counts the I2C transactions and bytes needed to read a subpage of pixel RAM,
+# one word per pixel as before against the block reads of RawImage.read(), on
+# a fake bus; run on a host with the MicroPython unix port:
+#   micropython -m mlx90640.image
+## @cond NO_DOXY
+if __name__ == "__main__":
+    from mlx90640.regmap import CameraInterface
+
+    class CountingI2C:
+        # fake bus which serves zeros and counts what is asked of it
+        def __init__(self):
+            self.transactions = 0
+            self.bytes = 0
+
+        def readfrom_mem_into(self, addr, mem_addr, buf, *, addrsize=8):
+            self.transactions += 1
+            self.bytes += len(buf)
+            for i in range(len(buf)):
+                buf[i] = 0
+
+    def per_pixel_read(iface, sp_range):
+        buf = bytearray(REG_SIZE)
+        for offset in sp_range:
+            iface.read_into(PIX_DATA_ADDRESS + offset, buf)
+
+    def block_read(iface, sp_range, sp_rows):
+        RawImage().read(iface, sp_range, sp_rows)
+
+    bus = CountingI2C()
+    iface = CameraInterface(bus, 0x33)
+    for name, subpage in (
+            ("chess", Subpage(ChessPattern, 0)),
+            ("chess rows 8-15", Subpage(ChessPattern, 0, range(8, 16))),
+            ("interleaved", Subpage(InterleavedPattern, 0)),
+            ("interleaved rows 8-15", Subpage(InterleavedPattern, 0, range(8, 16)))):
+        for how, read in (
+                ("per pixel", lambda: per_pixel_read(iface, subpage.sp_range())),
+                ("block", lambda: block_read(iface, subpage.sp_range(), subpage.sp_rows()))):
+            bus.transactions = bus.bytes = 0
+            read()
+            print(f"{name:22s} {how:9s}: {bus.transactions:4d} transactions, "
+                  f"{bus.bytes:5d} bytes")
+## @endcond
@@ -41,6 +41,13 @@ REGISTER_MAP = {
 
     # I2C Address
     0x8010 : field_desc('i2c_address',  FD_BYTE, 1),
+}
+
+# Auxiliary data in RAM, read as one block for compensation
+RAM_AUX_ADDRESS = const(0x0700)
+RAM_AUX_SIZE    = const(0x40)
+
+RAM_AUX_MAP = {
     0x0700 : field_desc('ta_vbe',       FD_WORD, signed=True),
     0x0708 : field_desc('cp_sp_0',      FD_WORD, signed=True),
     0x070A : field_desc('gain',         FD_WORD, signed=True),
@@ -48,6 +55,7 @@ REGISTER_MAP = {
     0x0728 : field_desc('cp_sp_1',      FD_WORD, signed=True),
     0x072A : field_desc('vdd_pix',      FD_WORD, signed=True),
 }
+REGISTER_MAP.update(RAM_AUX_MAP)
 
 # Calibration Data
 EEPROM_ADDRESS = const(0x2400)
@@ -152,6 +160,30 @@ class CameraInterface:
         self.i2c.writeto_mem(self.addr, mem_addr, buf, addrsize=16)
 
 
+class MemoryInterface:
+    # serves register reads from a snapshot of device memory instead of the bus
+    def __init__(self, buf, base_addr):
+        self.buf = buf              # snapshot of the memory block
+        self.base_addr = base_addr  # device address of the first word in buf
+        self._mv = memoryview(buf)
+
+    def _offset(self, mem_addr, size):
+        offset = (mem_addr - self.base_addr) * REG_SIZE
+        if offset < 0 or offset + size > len(self.buf):
+            raise ValueError(f"address out of range: 0x{mem_addr:04X}")
+        return offset
+
+    def read(self, mem_addr):
+        offset = self._offset(mem_addr, REG_SIZE)
+        return bytes(self._mv[offset:offset+REG_SIZE])
+    def read_into(self, mem_addr, buf):
+        offset = self._offset(mem_addr, len(buf))
+        buf[:] = self._mv[offset:offset+len(buf)]
+    def write(self, mem_addr, buf):
+        offset = self._offset(mem_addr, len(buf))
+        self._mv[offset:offset+len(buf)] = buf
+
+
 class ReadOnlyError(Exception): pass
 
 class RegisterMap:
@@ -7,6 +7,7 @@ from uctypes import (
     INT8, UINT8,
     INT16, UINT16,
     BFUINT16,
+    ARRAY,
     BF_POS,
     BF_LEN,
     BIG_ENDIAN,
@@ -17,6 +18,11 @@ from uctypes import (
 def array_filled(typecode, length, fill=0):
     return array(typecode, (fill for i in range(length)))
 
+def word_array(buf, length, signed=True):
+    # view buf as an array of big-endian 16-bit words without copying
+    layout = {'words' : (ARRAY | 0, (INT16 if signed else UINT16) | length)}
+    return uc_struct(addressof(buf), layout, BIG_ENDIAN).words
+
 def twos_complement(bits, value):
     if value < 0:
         return value + (1 << bits)
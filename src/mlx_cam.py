@@ -20,6 +20,7 @@ example.
 """
 #import scipy
 import gc
+import sys
 from array import array
 import utime as time
 from machine import Pin, I2C
@@ -28,6 +29,14 @@ from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
 from mlx90640.image import ChessPattern, InterleavedPattern
 
 
+## Acquisition state: waiting for the camera to have a subpage ready
+S_ACQ_WAIT = 0
+## Acquisition state: one subpage of the frame has been read
+S_ACQ_SUBPAGE = 1
+## Acquisition state: both subpages have been read and the frame is complete
+S_ACQ_DONE = 2
+
+
 class MLX_Cam:
     """!
     @brief   Class which wraps an MLX90640 thermal infrared camera driver to
@@ -35,7 +44,8 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=ChessPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, calib_cache=None,
+                 track_limits=None, patch_bad=True):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -45,6 +55,15 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   calib_cache Path of a file in which the camera calibration
+                 is cached between boots, or @c None to always recompute it
+        @param   track_limits @c 'v_ir' or @c 'buf' to find the minimum and
+                 maximum of that image array while each frame is processed,
+                 so they can be passed to @c get_csv() and @c get_bytes() as
+                 @c get_image().limits; @c None not to
+        @param   patch_bad If @c True, the pixels which the calibration marks
+                 as outliers or failed are replaced by the average of their
+                 neighbours as each frame is processed
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -60,16 +79,25 @@ class MLX_Cam:
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
         self._camera.set_pattern(pattern)
-        self._camera.setup()
+        self._camera.setup(calib_cache=calib_cache)
+        self._camera.image.track_limits = track_limits
+        self._camera.image.patch_bad = patch_bad
 
         ## A local reference to the image object within the camera driver
         self._image = self._camera.image
+        ## The camera state read along with the most recent subpage
+        self._state = None
+        ## Buffer in which one CSV row is formatted; 12 characters per pixel
+        #  fit any 32 bit value with its comma, plus the newline
+        self._row = bytearray(12 * width + 1)
+        ## A view of the row buffer, so rows are written without copying
+        self._row_mv = memoryview(self._row)
 
 
     
 
 
-    def get_csv(self, array, limits=None):
+    def get_csv(self, array, limits=None, array_limits=None):
         """!
         @brief   Generate a string containing image data in CSV format.
         @details This function generates a set of lines, each having one row of
@@ -78,25 +106,118 @@ class MLX_Cam:
         @param   array The array of data to be presented
         @param   limits A 2-iterable containing the maximum and minimum values
                  to which the data should be scaled, or @c None for no scaling
+        @param   array_limits The minimum and maximum of the data if they are
+                 already known, such as @c get_image().limits, or @c None to
+                 find them
         """
         if limits and len(limits) == 2:
-            scale = (limits[1] - limits[0]) / (max(array) - min(array))
-            offset = limits[0] - min(array)
+            scale, offset = _scaling(array, limits, array_limits)
         else:
             offset = 0.0
             scale = 1.0
         for row in range(self._height):
-            line = ""
-            for col in range(self._width):
-                pix = int((array[row * self._width + (self._width - col - 1)] * scale) + offset)
-                if col:
-                    line += ","
-                line += f"{pix}"
-#             line += "\r\n"
-            yield line
+            n = self._format_row(array, row, scale, offset)
+            yield self._row[:n].decode()
         return
 
 
+    def write_csv(self, stream, array, limits=None, array_limits=None):
+        """!
+        @brief   Write image data in CSV format to a stream.
+        @details Writes the same characters as printing each line from
+                 @c get_csv(), including the newline after each row, but
+                 formats the numbers straight into a buffer which is reused
+                 for every row, so a whole frame is written without
+                 allocating any strings.
+        @param   stream An object with a @c write() method taking a buffer,
+                 such as a @c machine.UART, a file opened in binary mode or
+                 @c sys.stdout
+        @param   array The array of data to be presented
+        @param   limits A 2-iterable containing the maximum and minimum values
+                 to which the data should be scaled, or @c None for no scaling
+        @param   array_limits The minimum and maximum of the data if they are
+                 already known, such as @c get_image().limits, or @c None to
+                 find them
+        """
+        if limits and len(limits) == 2:
+            scale, offset = _scaling(array, limits, array_limits)
+        else:
+            offset = 0.0
+            scale = 1.0
+        row_buf = self._row
+        for row in range(self._height):
+            n = self._format_row(array, row, scale, offset)
+            row_buf[n] = 0x0A  # newline
+            stream.write(self._row_mv[:n + 1])
+
+
+    def _format_row(self, array, row, scale, offset):
+        """!
+        @brief   Formats one row of CSV data into the row buffer
+        @details The columns are written right to left, as the camera image
+                 is mirrored
+        @returns The number of characters in the row
+        """
+        buf = self._row
+        width = self._width
+        base = row * width + width - 1
+        n = 0
+        for col in range(width):
+            if col:
+                buf[n] = 0x2C  # comma
+                n += 1
+            pix = int((array[base - col] * scale) + offset)
+            if pix < 0:
+                buf[n] = 0x2D  # minus sign
+                n += 1
+                pix = -pix
+            # count the digits, then fill them in from the right
+            digits = 1
+            power = 10
+            while pix >= power:
+                power *= 10
+                digits += 1
+            n += digits
+            pos = n
+            while digits:
+                pos -= 1
+                buf[pos] = 0x30 + pix % 10
+                pix //= 10
+                digits -= 1
+        return n
+
+
+    def acquire(self, shares=(), callback=None):
+        """!
+        @brief   Generator which captures frames without blocking.
+        @details Each call to @c next() does a bounded amount of work and
+                 yields one of @c S_ACQ_WAIT, @c S_ACQ_SUBPAGE or
+                 @c S_ACQ_DONE, so the generator can be used directly as the
+                 function of a @c cotask.Task, letting other tasks such as
+                 motor control run while the camera integrates. Frames are
+                 captured continuously.
+        @param   shares A tuple whose first item, if present, is a
+                 @c task_share.Share which is set to 1 when a frame completes
+        @param   callback A function called with the image each time a frame
+                 completes, or @c None
+        """
+        frame_done = shares[0] if shares else None
+        while True:
+            for subpage in (0, 1):
+                while not self._camera.has_data:
+                    yield S_ACQ_WAIT
+                self._camera.read_image(subpage)
+                self._state = self._camera.read_state()
+                image = self._camera.process_image(subpage, self._state)
+                if subpage == 0:
+                    yield S_ACQ_SUBPAGE
+
+            if frame_done is not None:
+                frame_done.put(1)
+            if callback is not None:
+                callback(image)
+            yield S_ACQ_DONE
+
     def get_image(self):
         """!
         @brief   Get one image from a MLX90640 camera.
@@ -106,17 +227,26 @@ class MLX_Cam:
                  ChessPattern (default) mode as it probably should be.
         @returns A reference to the image object we've just filled with data
         """
-        for subpage in (0, 1):
-            while not self._camera.has_data:
-                time.sleep_ms(50)
-                print('.', end='')
-            self._camera.read_image(subpage)
-            state = self._camera.read_state()
-            image = self._camera.process_image(subpage, state)
-
-        return image
+        frames = self.acquire()
+        while next(frames) != S_ACQ_DONE:
+            time.sleep_ms(5)
+
+        return self._image
+
+    def get_temperatures(self, out=None):
+        """!
+        @brief   Compute the object temperature of every pixel.
+        @details Converts the most recent image from @c get_image() into
+                 temperatures in degrees Celsius in a single pass over the
+                 frame, using ulab or NumPy when one is available.
+        @param   out An @c array('f') of 768 elements to fill, or @c None to
+                 use a buffer owned by the image
+        @returns The array of temperatures, in the same pixel order as the
+                 image
+        """
+        return self._image.calc_temperature_frame(self._state, out)
     
-    def get_bytes(self, array, limits=None):
+    def get_bytes(self, array, limits=None, array_limits=None):
         """!
         @brief   Generate a bytes object containing image data.
         @details This function returns a bytes object containing the values
@@ -124,11 +254,12 @@ class MLX_Cam:
         @param   array The array of data to be presented
         @param   limits A 2-iterable containing the maximum and minimum values
                  to which the data should be scaled, or @c None for no scaling
+        @param   array_limits The minimum and maximum of the data if they are
+                 already known, such as @c get_image().limits, or @c None to
+                 find them
         """
         if limits and len(limits) == 2:
-            #print("here")
-            scale = (limits[1] - limits[0]) / (max(array) - min(array))
-            offset = limits[0] - min(array)
+            scale, offset = _scaling(array, limits, array_limits)
         else:
             offset = 0.0
             scale = 1.0
@@ -143,6 +274,31 @@ class MLX_Cam:
     
 
 
+def _scaling(array, limits, array_limits=None):
+    """!
+    @brief   Finds the scale and offset used by @c MLX_Cam.get_csv() and
+             @c MLX_Cam.get_bytes()
+    @details If the minimum and maximum of the array aren't given, they are
+             found in a single pass
+    @param   array The array of data to be scaled
+    @param   limits A 2-iterable of the values to which the data is scaled
+    @param   array_limits A 2-iterable of the minimum and maximum of the
+             data, or @c None
+    @returns A tuple of the scale and offset
+    """
+    if array_limits is None:
+        low = high = array[0]
+        for value in array:
+            if value < low:
+                low = value
+            elif value > high:
+                high = value
+    else:
+        low, high = array_limits[0], array_limits[1]
+    # the offset is added after scaling, as it always has been
+    return (limits[1] - limits[0]) / (high - low), limits[0] - low
+
+
 def calculate_centroid(camera, image):
     """!
     @brief   Calculates centroid from image
@@ -308,7 +464,7 @@ if __name__ == "__main__":
     print(f"I2C Scan: {scanhex}")
 
     # Create the camera object and set it up in default mode
-    camera = MLX_Cam(i2c_bus)
+    camera = MLX_Cam(i2c_bus, track_limits='v_ir')
 
     while True:
         try:
@@ -331,9 +487,8 @@ if __name__ == "__main__":
             if show_image:
                 camera.ascii_image(image.buf)
             elif show_csv:
-                for line in camera.get_csv(image.v_ir, limits=(0, 99)):
-                    # cleared_image.append(line)
-                    print(line)
+                camera.write_csv(sys.stdout, image.v_ir, limits=(0, 99),
+                                 array_limits=image.limits)
             else:
                 # camera.ascii_art(image.v_ir)
                 pass
@@ -356,7 +511,8 @@ if __name__ == "__main__":
             centroid_time = time.ticks_ms()
 
             second_start = time.ticks_ms()
-            image_array = camera.get_bytes(image.v_ir, limits=(0, 99))
+            image_array = camera.get_bytes(image.v_ir, limits=(0, 99),
+                                           array_limits=image.limits)
             getbytestime = time.ticks_ms()
             c_x2, c_y2 = calculate_centroid_bytes(image_array, upper=100, scalar=0.5)
             cbytestime = time.ticks_ms()
@@ -29,10 +29,30 @@ example.
 import gc
 from array import array
 import utime as time
-from machine import Pin, I2C
+try:
+    from machine import Pin, I2C
+except ImportError:
+    # not needed when replaying a recorded log on a PC, see frame_record.py
+    Pin = I2C = None
 from mlx90640 import MLX90640
 from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
 from mlx90640.image import ChessPattern, InterleavedPattern
+from centroid import weighted_centroid, weighted_centroid_raw
+from threshold import new_histogram, otsu_threshold
+
+# The viper emitter isn't available on every port; fall back to plain Python
+try:
+    from cam_viper import centroid_raw as _centroid_raw_viper
+except (ImportError, SyntaxError):
+    _centroid_raw_viper = None
+
+
+## Acquisition state: waiting for the camera to have a subpage ready
+S_ACQ_WAIT = 0
+## Acquisition state: one subpage of the frame has been read
+S_ACQ_SUBPAGE = 1
+## Acquisition state: both subpages have been read and the frame is complete
+S_ACQ_DONE = 2
 
 
 class MLX_Cam:
@@ -42,7 +62,9 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=InterleavedPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, calib_cache=None,
+                 double_buffer=True, roi_margin=None,
+                 auto_threshold=otsu_threshold):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -52,6 +74,18 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   calib_cache Path of a file in which the camera calibration
+                 is cached between boots, or @c None to always recompute it
+        @param   double_buffer If @c True, frames are read into a second
+                 buffer so that the last completed frame stays untouched
+                 while the next one is captured
+        @param   roi_margin If not @c None, once @c find_target_raw() finds a
+                 target only the band of rows within this many rows of it is
+                 read in following frames, until the target is lost
+        @param   auto_threshold A function which chooses a limit from a
+                 histogram of foreground values, used when the centroid and
+                 angle functions are given a limit of @c None; see
+                 @c threshold.py
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -67,11 +101,56 @@ class MLX_Cam:
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
         self._camera.set_pattern(pattern)
-        self._camera.setup()
+        self._camera.setup(calib_cache=calib_cache, double_buffer=double_buffer)
 
-        ## A local reference to the image object within the camera driver
+        ## A local reference to the last completed raw image
         self._image = self._camera.raw
-
+        ## Accumulators for the viper centroid routine
+        self._sums = array('i', (0, 0))
+        ## Reference-subtracted frame filled by @c get_foreground()
+        self._foreground = bytearray(IMAGE_SIZE)
+        ## Histogram of the foreground values, filled with the foreground
+        self._hist = new_histogram()
+        ## The function which chooses a limit when none is given
+        self.auto_threshold = auto_threshold
+        ## Rows either side of a target kept in the region of interest
+        self.roi_margin = roi_margin
+        ## The band of rows read each frame, a @c range, or @c None for all
+        self.roi = None
+
+
+    def acquire(self, shares=(), callback=None):
+        """!
+        @brief   Generator which captures frames without blocking.
+        @details Each call to @c next() does a bounded amount of work and
+                 yields one of @c S_ACQ_WAIT, @c S_ACQ_SUBPAGE or
+                 @c S_ACQ_DONE, so the generator can be used directly as the
+                 function of a @c cotask.Task, letting other tasks such as
+                 motor control run while the camera integrates. Frames are
+                 captured continuously.
+        @param   shares A tuple whose first item, if present, is a
+                 @c task_share.Share which is set to 1 when a frame completes
+        @param   callback A function called with the image each time a frame
+                 completes, or @c None
+        """
+        frame_done = shares[0] if shares else None
+        while True:
+            # both subpages of a frame cover the same rows
+            rows = self.roi
+            for subpage in (0, 1):
+                while not self._camera.has_data:
+                    yield S_ACQ_WAIT
+                self._camera.read_image(subpage, rows)
+                if subpage == 0:
+                    yield S_ACQ_SUBPAGE
+
+            # hand the completed frame over; the next one goes to the other buffer
+            image = self._image = self._camera.swap_raw()
+            if frame_done is not None:
+                frame_done.put(1)
+            if callback is not None:
+                callback(image)
+            yield S_ACQ_DONE
 
     def get_image(self):
         """!
@@ -81,16 +160,15 @@ class MLX_Cam:
                  grabbed and combined (maybe; this is the raw version, so the
                  combination is sketchy and not fully tested). It is assumed
                  that the camera is in the ChessPattern (default) mode as it
-                 probably should be.
+                 probably should be. With double buffering the image stays
+                 valid while the following frame is being captured.
         @returns A reference to the image object we've just filled with data
         """
-        for subpage in (0, 1):
-            while not self._camera.has_data:
-                time.sleep_ms(50)
-                print('.', end='')
-            image = self._camera.read_image(subpage)
+        frames = self.acquire()
+        while next(frames) != S_ACQ_DONE:
+            time.sleep_ms(5)
 
-        return image
+        return self._image
 
 
     def get_bytes(self, array):
@@ -171,6 +249,287 @@ class MLX_Cam:
         return cent_x, cent_y
 
 
+    def get_foreground(self, ref_array, raw, out=None, hist=None, rows=None):
+        """!
+        @brief   Subtracts the reference image from a raw frame.
+        @details Produces the same pixel values that
+                 @c calculate_centroid_bytes() compares against its limit,
+                 clipped to the range 0 to 255, in one pass from the raw frame.
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   out A bytearray of 768 bytes to fill, or @c None to use a
+                 buffer owned by this object
+        @param   hist A 256 bin @c array('H') which is filled with a
+                 histogram of the values in the same pass, or @c None
+        @param   rows A @c range of rows to subtract and count, or @c None for
+                 the whole image; pixels of @c out outside it are left as they were
+        @returns The bytearray of reference-subtracted pixel values
+        """
+        if out is None:
+            out = self._foreground
+        if rows is None:
+            start, end = 0, IMAGE_SIZE
+        else:
+            start, end = rows.start * NUM_COLS, rows.stop * NUM_COLS
+        if hist is not None:
+            for n in range(256):
+                hist[n] = 0
+        for i in range(start, end):
+            byte = ((raw[i] + 128) & 0xFF) - ref_array[i] + 255
+            if byte < 0:
+                byte = 0
+            elif byte > 255:
+                byte = 255
+            out[i] = byte
+            if hist is not None:
+                hist[byte] += 1
+        return out
+
+
+    def foreground_histogram(self, ref_array, image_array, hist=None):
+        """!
+        @brief   Makes a histogram of the reference-subtracted values of a byte frame
+        @details Counts the same values that @c calculate_centroid_bytes()
+                 compares against its limit, clipped to the range 0 to 255
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   image_array A bytearray of image values in order starting at top left pixel
+        @param   hist A 256 bin @c array('H') to fill, or @c None to use one
+                 owned by this object
+        @returns The histogram
+        """
+        if hist is None:
+            hist = self._hist
+        for n in range(256):
+            hist[n] = 0
+        for i in range(IMAGE_SIZE):
+            byte = image_array[i] - ref_array[i] + 255
+            if byte < 0:
+                byte = 0
+            elif byte > 255:
+                byte = 255
+            hist[byte] += 1
+        return hist
+
+
+    def find_angle_blob(self, ref_array, raw, detector, limit = 20):
+        """!
+        @brief Calculates the angle to the best scoring warm blob in the view cone
+        @details Unlike @c find_angle(), separate warm objects are not averaged
+                 together; the centroid of the blob which the detector ranks
+                 highest is used
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   detector A @c blob_detect.BlobDetector
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel,
+                 or @c None to choose it from the frame with @c auto_threshold
+        @returns A tuple of pitch yaw angles for movement of the gun
+        """
+        if limit is None:
+            frame = self.get_foreground(ref_array, raw, hist=self._hist)
+            limit = self.auto_threshold(self._hist)
+        else:
+            frame = self.get_foreground(ref_array, raw)
+        blobs = detector.detect(frame, limit)
+        # If error return an unreasonable value for error detection later
+        if not blobs:
+            return -60, -60
+        return self.centroid_to_angle(blobs[0].x, blobs[0].y)
+
+
+    def set_roi(self, c_y, margin):
+        """!
+        @brief   Limits reading of following frames to a band of rows around a target
+        @param   c_y The centroid row of the target, counted from 1 at the bottom
+        @param   margin The number of rows either side of the target's row to read
+        """
+        row = int(NUM_ROWS - c_y + 0.5)
+        self.roi = range(max(0, row - margin), min(NUM_ROWS, row + margin + 1))
+
+
+    def clear_roi(self):
+        """!
+        @brief   Goes back to reading whole frames
+        """
+        self.roi = None
+
+
+    def find_angle_smoothed(self, ref_array, raw, integral, limit = 20,
+                            radius = 1):
+        """!
+        @brief Calculates the angle to the warm pixels after box filtering the frame
+        @details The reference-subtracted frame is averaged over squares of
+                 side 2 * radius + 1 using a summed-area table, so single hot
+                 pixels no longer reach the limit, then the intensity-weighted
+                 centroid of what is left is used
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   integral An @c integral_image.IntegralImage
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel,
+                 or @c None to choose it from the frame with @c auto_threshold
+        @param   radius The number of pixels on each side of each pixel averaged with it
+        @returns A tuple of pitch yaw angles for movement of the gun
+        """
+        if limit is None:
+            frame = self.get_foreground(ref_array, raw, hist=self._hist)
+            limit = self.auto_threshold(self._hist)
+        else:
+            frame = self.get_foreground(ref_array, raw)
+        integral.build(frame)
+        # the filtered frame goes back into the foreground buffer
+        c_x, c_y, num = weighted_centroid(integral.box_filter(radius, frame), limit)
+        # If error return an unreasonable value for error detection later
+        if num == 0:
+            return -60, -60
+        return self.centroid_to_angle(c_x, c_y)
+
+
+    def calculate_centroid_raw(self, ref_array, raw, limit = 128, rows = None):
+        """!
+        @brief   Calculates the centroid of the warm pixels directly from a raw frame
+        @details Gives the same result as @c get_bytes() followed by
+                 @c calculate_centroid_bytes(), but in a single pass with
+                 integer accumulators and without allocating intermediate
+                 arrays. A viper-compiled version is used when the port
+                 supports it.
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel
+        @param   rows A @c range of rows to look at, or @c None for the whole image
+        @returns A tuple of x, y values of the centroid position and the number
+                 of warm pixels; the position is -1, -1 if there are none
+        """
+        if rows is None:
+            start, end = 0, IMAGE_SIZE
+        else:
+            start, end = rows.start * NUM_COLS, rows.stop * NUM_COLS
+
+        if _centroid_raw_viper is not None:
+            num = _centroid_raw_viper(raw, ref_array, limit, self._sums, start, end)
+            x_sum = self._sums[0]
+            y_sum = self._sums[1]
+        else:
+            # byte value of get_bytes() minus (ref - 255), compared to the limit
+            thresh = limit - 255
+            num = 0
+            x_sum = 0
+            y_sum = 0
+            for i in range(start, end):
+                if ((raw[i] + 128) & 0xFF) - ref_array[i] > thresh:
+                    x_sum += (i & 31) + 1
+                    y_sum += 24 - (i >> 5)
+                    num += 1
+
+        if num == 0:
+            return -1, -1, 0
+        return x_sum/num, y_sum/num, num
+
+
+    def calculate_centroid_weighted(self, ref_array, raw, limit = 128,
+                                    rows = None, peak_fit = False):
+        """!
+        @brief   Calculates the intensity-weighted centroid directly from a raw frame
+        @details Each warm pixel is weighted by how far it is above the limit,
+                 giving a sub-pixel position; see @c centroid.py
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel
+        @param   rows A @c range of rows to look at, or @c None for the whole image
+        @param   peak_fit If @c True, return the peak of parabolas fitted
+                 across the hottest pixel instead of the centroid
+        @returns A tuple of x, y values of the centroid position and the total
+                 weight of the warm pixels; the position is -1, -1 if there are none
+        """
+        if rows is None:
+            start, end = 0, IMAGE_SIZE
+        else:
+            start, end = rows.start * NUM_COLS, rows.stop * NUM_COLS
+        return weighted_centroid_raw(raw, ref_array, limit, start, end, peak_fit)
+
+
+    def centroid_to_angle(self, c_x, c_y):
+        """!
+        @brief   Converts a centroid position into angles in the camera's view cone
+        @details Scales based on the specified view angles of the camera
+                 (55 x 35 degrees), assuming linear optics
+        @param   c_x The centroid column, counted from 1 at the left
+        @param   c_y The centroid row, counted from 1 at the bottom
+        @returns A tuple of yaw, pitch angles in degrees from the image center
+        """
+        # center reference the image
+        cx_f = c_x-16
+        cy_f = c_y-12
+
+        # Calculate angles based on view angle and resolution (assuming a linear scaling for both)
+        x_deg = cx_f * (55/32)
+        y_deg = cy_f * (35/24)
+
+        return x_deg, y_deg
+
+
+    def find_target_raw(self, ref_array, raw, limit = 20, weighted = False,
+                        peak_fit = False):
+        """!
+        @brief Finds the position of the target in the image directly from a raw frame
+        @details Only the rows of the region of interest are searched; if
+                 @c roi_margin is set, the region is moved to the target
+                 when one is found and cleared when it is lost, so the next
+                 frame is read whole.
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel,
+                 or @c None to choose it from the frame with @c auto_threshold
+        @param   weighted If @c True, use the intensity-weighted centroid from
+                 @c calculate_centroid_weighted()
+        @param   peak_fit If @c True, use the fitted peak from
+                 @c calculate_centroid_weighted()
+        @returns A tuple of the x, y centroid position, counted from 1 at the
+                 left and bottom of the image, or @c None if there is no target
+        """
+        if limit is None:
+            # only the rows of the region of interest were read this frame
+            self.get_foreground(ref_array, raw, hist=self._hist, rows=self.roi)
+            limit = self.auto_threshold(self._hist)
+            # the centroid tests don't clip at 255, so check for nothing warm here
+            if limit >= 255:
+                self.roi = None
+                return None
+        if weighted or peak_fit:
+            c_x, c_y, num = self.calculate_centroid_weighted(
+                ref_array, raw, limit, self.roi, peak_fit)
+        else:
+            c_x, c_y, num = self.calculate_centroid_raw(ref_array, raw, limit,
+                                                        self.roi)
+        if num == 0:
+            self.roi = None
+            return None
+        if self.roi_margin is not None:
+            self.set_roi(c_y, self.roi_margin)
+        return c_x, c_y
+
+
+    def find_angle_raw(self, ref_array, raw, limit = 20, weighted = False,
+                       peak_fit = False):
+        """!
+        @brief Calculates the angle in the cameras view cone directly from a raw frame
+        @details Same as @c find_angle() but uses the fused centroid of
+                 @c find_target_raw(), skipping @c get_bytes()
+        @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel
+        @param   raw The raw @c array('h') of pixel values, such as @c get_image().pix
+        @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel,
+                 or @c None to choose it from the frame with @c auto_threshold
+        @param   weighted If @c True, use the intensity-weighted centroid from
+                 @c calculate_centroid_weighted()
+        @param   peak_fit If @c True, use the fitted peak from
+                 @c calculate_centroid_weighted()
+        @returns A tuple of pitch yaw angles for movement of the gun
+        """
+        target = self.find_target_raw(ref_array, raw, limit, weighted, peak_fit)
+        # If error return an unreasonable value for error detection later
+        if target is None:
+            return -60, -60
+        return self.centroid_to_angle(target[0], target[1])
+
+
     def find_angle(self,ref_array, image_array, limit = 20):
         """!
         @brief Calculates the angle in the cameras view cone
@@ -179,27 +538,23 @@ class MLX_Cam:
         @param   ref_array A bytearray of image values for a cold wall in order starting at top left pixel 
         @param   image_array A bytearray of image values in order starting at top left pixel
                  Lines are 32 long, there are 24 lines total
-                 @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel
+                 @param   limit A 8 bit integer value for the lower limit value the camera considers as a warm pixel,
+                 or @c None to choose it from the frame with @c auto_threshold
         @returns A tuple of pitch yaw angles for movement of the gun  
         """
+        if limit is None:
+            limit = self.auto_threshold(self.foreground_histogram(ref_array, image_array))
+            # calculate_centroid_bytes() doesn't clip at 255, so check for nothing warm here
+            if limit >= 255:
+                return -60, -60
         # Calculate the centroid
         c_x2, c_y2 = self.calculate_centroid_bytes(ref_array, image_array, limit)
         # If error return an unreasonable value for error detection later
         if c_x2 < 0 or c_y2 < 0:
             return -60, -60
         
-        # center reference the image
-        cx = c_x2
-        cx_f = cx-16
-        cy_f = c_y2-12
-
-        
-        # Calculate angles based on view angle and resolution (assuming a linear scaling for both)
-        x_deg = cx_f * (55/32)
-        y_deg = cy_f * (35/24)
-        
         # Return the angle
-        return x_deg, y_deg
+        return self.centroid_to_angle(c_x2, c_y2)
         #return y_deg,x_deg
         
 
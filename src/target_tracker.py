@@ -0,0 +1,187 @@
+"""!
+@file target_tracker.py
+This file contains a small multi-target tracker which follows targets from
+one camera frame to the next, so the turret can aim at where a moving target
+will be when the motors get there rather than where it was when the picture
+was taken.
+
+Detections are associated with tracks by nearest neighbour within a gate, and
+each track's position and velocity are smoothed with an alpha-beta filter.
+Track state lives in arrays which are allocated when the tracker is created.
+"""
+
+from mlx90640.utils import array_filled
+from timing import ticks_diff
+
+
+class TargetTracker:
+    """!
+    @brief   Tracks several targets across frames with alpha-beta filters.
+    @details Positions are in whatever units the detections are given in.
+             The turret gives it target positions in pixels from
+             @c mlx_cam_mod.MLX_Cam.find_target_raw(), counted from 1 at the
+             left and bottom of the image, and looks up the aim afterwards;
+             angles from @c find_angle() work as well if the gate is given
+             in degrees. Times are in milliseconds as returned by
+             @c utime.ticks_ms().
+    """
+
+    def __init__(self, max_tracks=4, gate=5.0, alpha=0.85, beta=0.3,
+                 max_misses=2):
+        """!
+        @brief   Allocates the track arrays.
+        @param   max_tracks The most targets which are tracked at once
+        @param   gate The largest distance between a track's predicted
+                 position and a detection for them to be associated, in the
+                 units of the positions: pixels for the turret's
+                 @c find_target_raw() positions
+        @param   alpha The position gain of the filter, 0 to 1
+        @param   beta The velocity gain of the filter, 0 to 1
+        @param   max_misses The number of frames in a row a track may go
+                 without a detection before it is dropped
+        """
+        ## The square of the association gate
+        self.gate_sq = gate * gate
+        ## The position gain of the alpha-beta filter
+        self.alpha = alpha
+        ## The velocity gain of the alpha-beta filter
+        self.beta = beta
+        ## The number of missed frames after which a track is dropped
+        self.max_misses = max_misses
+
+        ## The number of track slots
+        self.max_tracks = max_tracks
+        ## Filtered positions of the tracks
+        self.x = array_filled('f', max_tracks)
+        self.y = array_filled('f', max_tracks)
+        ## Filtered velocities of the tracks, per millisecond
+        self.vx = array_filled('f', max_tracks)
+        self.vy = array_filled('f', max_tracks)
+        ## Time of each track's last update
+        self.t = array_filled('i', max_tracks)
+        ## Number of detections associated with each track, 0 if unused
+        self.hits = array_filled('H', max_tracks)
+        ## Number of frames in a row each track has gone undetected
+        self.misses = array_filled('B', max_tracks)
+        self._matched = array_filled('B', max_tracks)
+
+
+    def update(self, detections, t_ms):
+        """!
+        @brief   Updates the tracks with the detections from one frame.
+        @param   detections A sequence of (x, y) target positions; may be empty
+        @param   t_ms The time at which the frame was captured
+        """
+        x = self.x
+        y = self.y
+        vx = self.vx
+        vy = self.vy
+        hits = self.hits
+        matched = self._matched
+        for trk in range(self.max_tracks):
+            matched[trk] = 0
+
+        for det_x, det_y in detections:
+            # nearest unmatched track whose prediction is within the gate
+            best = -1
+            best_d = self.gate_sq
+            for trk in range(self.max_tracks):
+                if not hits[trk] or matched[trk]:
+                    continue
+                dt = ticks_diff(t_ms, self.t[trk])
+                dx = det_x - (x[trk] + vx[trk] * dt)
+                dy = det_y - (y[trk] + vy[trk] * dt)
+                d = dx * dx + dy * dy
+                if d <= best_d:
+                    best, best_d = trk, d
+
+            if best >= 0:
+                self._correct(best, det_x, det_y, t_ms)
+            else:
+                self._start(det_x, det_y, t_ms)
+
+        for trk in range(self.max_tracks):
+            if hits[trk] and not matched[trk]:
+                self.misses[trk] += 1
+                if self.misses[trk] > self.max_misses:
+                    hits[trk] = 0
+
+
+    def _correct(self, trk, det_x, det_y, t_ms):
+        """!
+        @brief   Applies the alpha-beta correction for an associated detection
+        """
+        dt = ticks_diff(t_ms, self.t[trk])
+        px = self.x[trk] + self.vx[trk] * dt
+        py = self.y[trk] + self.vy[trk] * dt
+        rx = det_x - px
+        ry = det_y - py
+        self.x[trk] = px + self.alpha * rx
+        self.y[trk] = py + self.alpha * ry
+        if dt > 0:
+            self.vx[trk] += self.beta * rx / dt
+            self.vy[trk] += self.beta * ry / dt
+        self.t[trk] = t_ms
+        self.hits[trk] += 1
+        self.misses[trk] = 0
+        self._matched[trk] = 1
+
+
+    def _start(self, det_x, det_y, t_ms):
+        """!
+        @brief   Starts a track in a free slot, or replaces the weakest track
+                 which wasn't detected in this frame
+        """
+        slot = -1
+        for trk in range(self.max_tracks):
+            if not self.hits[trk]:
+                slot = trk
+                break
+            if not self._matched[trk] and (slot < 0 or self.hits[trk] < self.hits[slot]):
+                slot = trk
+        if slot < 0:
+            return
+        self.x[slot] = det_x
+        self.y[slot] = det_y
+        self.vx[slot] = 0.0
+        self.vy[slot] = 0.0
+        self.t[slot] = t_ms
+        self.hits[slot] = 1
+        self.misses[slot] = 0
+        self._matched[slot] = 1
+
+
+    def best(self):
+        """!
+        @brief   Finds the track which has been detected most often.
+        @returns The index of the track, or -1 if there are no tracks
+        """
+        best = -1
+        for trk in range(self.max_tracks):
+            if self.hits[trk] and (best < 0 or self.hits[trk] > self.hits[best]):
+                best = trk
+        return best
+
+
+    def predict(self, trk, t_ms):
+        """!
+        @brief   Predicts the position of a track at a given time.
+        @param   trk The index of the track
+        @param   t_ms The time for which the position is wanted
+        @returns A tuple of the predicted x, y position
+        """
+        dt = ticks_diff(t_ms, self.t[trk])
+        return self.x[trk] + self.vx[trk] * dt, self.y[trk] + self.vy[trk] * dt
+
+
+    def predict_best(self, t_ms):
+        """!
+        @brief   Predicts the position of the best track at a given time.
+        @param   t_ms The time for which the position is wanted
+        @returns A tuple of the predicted x, y position, or @c None if there
+                 are no tracks
+        """
+        trk = self.best()
+        if trk < 0:
+            return None
+        return self.predict(trk, t_ms)
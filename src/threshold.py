@@ -0,0 +1,112 @@
+"""!
+@file threshold.py
+This file contains functions which choose the limit above which a pixel is
+considered warm from a 256 bin histogram of the pixel values of a frame, so
+the limit doesn't have to be tuned by hand for every room. The histogram can
+be filled while the frame itself is being made, for example by
+@c mlx_cam_mod.MLX_Cam.get_foreground(); choosing the limit then takes a
+fixed amount of time however large the frame is.
+
+Each function takes a histogram and returns a limit in the sense used by the
+centroid functions in @c mlx_cam_mod: pixels with values above the limit are
+warm. A limit of 255 means that no pixel is warm.
+"""
+
+from array import array
+
+
+def new_histogram():
+    """!
+    @brief   Allocates an empty 256 bin histogram
+    @returns An @c array('H') of 256 zeros
+    """
+    return array('H', (0 for _ in range(256)))
+
+
+def otsu_threshold(hist, min_contrast=16):
+    """!
+    @brief   Chooses a limit with Otsu's method.
+    @details The limit splits the pixels into the two groups which have the
+             largest variance between them. A frame with nothing warm in it
+             still has some spread, so if the means of the two groups are
+             less than @c min_contrast apart the frame is taken to be all
+             background.
+    @param   hist A histogram of 256 pixel counts
+    @param   min_contrast The smallest difference between the mean values of
+             the warm and cold pixels for them to count as separate groups
+    @returns The limit, 0 to 255
+    """
+    total = 0
+    value_sum = 0
+    for value in range(256):
+        count = hist[value]
+        total += count
+        value_sum += value * count
+    if total == 0:
+        return 255
+
+    best = 255
+    best_score = 0.0
+    contrast = 0.0
+    below = 0
+    below_sum = 0
+    for value in range(255):
+        below += hist[value]
+        if below == 0:
+            continue
+        above = total - below
+        if above == 0:
+            break
+        below_sum += value * hist[value]
+        # the between-class variance is diff**2 / (below*above) times a
+        # constant, and diff / (below*above) is the difference of the means
+        diff = value_sum * below - below_sum * total
+        score = diff * diff / (below * above)
+        if score > best_score:
+            best, best_score = value, score
+            contrast = diff / (below * above)
+
+    if contrast < min_contrast:
+        return 255
+    return best
+
+
+def percentile_threshold(hist, fraction=0.98):
+    """!
+    @brief   Chooses a limit so that a given fraction of the pixels are below it.
+    @param   hist A histogram of 256 pixel counts
+    @param   fraction The fraction of the pixels, 0 to 1, which are not warm
+    @returns The limit, 0 to 255
+    """
+    total = 0
+    for value in range(256):
+        total += hist[value]
+    wanted = fraction * total
+    below = 0
+    for value in range(256):
+        below += hist[value]
+        if below >= wanted:
+            return value
+    return 255
+
+
+# The test code builds the histogram of a synthetic frame with a warm object
+# on a noisy background and prints the limits chosen
+## @cond NO_DOXY don't document the test code in the driver documentation
+if __name__ == "__main__":
+    hist = new_histogram()
+    seed = 1
+    for i in range(768):
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        value = 40 + (seed >> 26)
+        if 10 <= i % 32 <= 14 and 8 <= i // 32 <= 13:
+            value += 120
+        hist[value] += 1
+    print(f"Otsu limit: {otsu_threshold(hist)}")
+    print(f"98th percentile limit: {percentile_threshold(hist)}")
+
+    empty = new_histogram()
+    empty[50] = 700
+    empty[52] = 68
+    print(f"Otsu limit with nothing warm: {otsu_threshold(empty)}")
+## @endcond
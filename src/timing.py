@@ -0,0 +1,30 @@
+"""!
+@file timing.py
+This file gives the tick functions of MicroPython's @c utime module to code
+which also runs on a PC, such as the test code at the bottom of the image
+processing modules. Under MicroPython the functions are those of @c utime;
+elsewhere they are made from @c time.perf_counter() and don't wrap around.
+"""
+
+try:
+    from utime import ticks_ms, ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        """!
+        @brief   Gets a time stamp in milliseconds
+        """
+        return int(perf_counter() * 1000)
+
+    def ticks_us():
+        """!
+        @brief   Gets a time stamp in microseconds
+        """
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        """!
+        @brief   Finds the time from tick @c b to tick @c a
+        """
+        return a - b